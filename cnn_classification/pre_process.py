@@ -1,11 +1,12 @@
 # Author: Kim Hammar <kimham@kth.se> KTH 2018
 
-import gensim
 import numpy as np
 import tensorflow as tf
 from tensorflow.contrib import learn
 import pyspark
 import json
+import os
+import sys
 import operator
 from nltk.stem import WordNetLemmatizer
 from snorkel import SnorkelSession
@@ -13,6 +14,9 @@ from snorkel.learning.gen_learning import GenerativeModel
 from scipy.sparse import csr_matrix
 from nltk.corpus import stopwords
 from nltk.tokenize import TweetTokenizer
+# The word vectors store is shared with the information extraction, which writes it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from information_extraction import vector_store
 
 """
 Script for preprocessing data to make it suitable for training the classifier 
@@ -273,9 +277,8 @@ def combine_labels_features(featuresPath, labelsPath, testFeaturesPath, testLabe
 
     # If using pre-trained embeddings, load them and initialize an embedding matrix for all words in the vocabulary
     if(vectorsPath != ""):
-        # Load pre-trained embeddings (depending on which gensim version you use)
-        #model = gensim.models.KeyedVectors.load_word2vec_format(vectorsPath, binary=False)
-        model = gensim.models.Word2Vec.load_word2vec_format(vectorsPath, binary=False)
+        # Load pre-trained embeddings (memory-mapped store converted from the .vec file)
+        model = vector_store.load(vectorsPath)
         vocab_size = len(vocab_processor.vocabulary_)
         emb_size = 300
         embeddings = np.zeros((vocab_size, emb_size))
@@ -443,14 +446,36 @@ def pre_process_labels(inputPath, outputPath):
     with open(outputPath, 'w') as outfile:
         json.dump(cleaned_labels, outfile)
 
+# Columns of the information extraction results that the labels are made of
+label_columns = ["id", "text_clustering", "google_vision_classification", "deep_detect_classification",
+                 "clarifai_classification", "deepomatic_classification"]
+
+
+def is_parquet(path):
+    """ Whether a spark output directory is in parquet format"""
+    return os.path.isdir(path) and any(name.endswith(".parquet") for name in os.listdir(path))
+
+
+def read_labels(sc, path, columns):
+    """
+    Read the labels of a spark output directory as dicts, only the given columns of parquet output are read,
+    JSON text output is parsed
+    """
+    if is_parquet(path):
+        df = pyspark.SQLContext(sc).read.parquet(path)
+        df = df.select([column for column in columns if column in df.columns])
+        return df.rdd.map(lambda row: row.asDict(recursive=True)).collect()
+    text_file = sc.textFile(path)
+    text_file = text_file.repartition(1)
+    return map(lambda x: json.loads(x), text_file.collect())
+
+
 def combine_labels(inputPaths, outputPath):
     """ Combine labels stored in spark parallelized format into single file """
     sc = pyspark.SparkContext(conf=sparkConf())
     totalLabels = []
     for path in inputPaths:
-        text_file = sc.textFile(path)
-        text_file = text_file.repartition(1)
-        labels = text_file.collect()
+        labels = read_labels(sc, path, label_columns)
         totalLabels = totalLabels + labels
     with open(outputPath, 'w') as outfile:
         json.dump(totalLabels, outfile)
@@ -467,10 +492,7 @@ def combine_labels2(inputPaths, outputPath, textAnalysisPath):
     sc = pyspark.SparkContext(conf=sparkConf())
     totalLabels = []
     for path in inputPaths:
-        text_file = sc.textFile(path)
-        text_file = text_file.repartition(1)
-        labels = text_file.collect()
-        labels = map(lambda x: json.loads(x), labels)
+        labels = read_labels(sc, path, label_columns + ["clothing"])
         totalLabels = totalLabels + labels
 
     totalLabels = filter(lambda x: x["clothing"] == True, totalLabels)
@@ -561,9 +583,8 @@ def keyword_labeling_funs(distant_supervision_labels_path, featuresPath, vectors
     """ Apply basic LFs based on keywords matching on the train set """
     labels = json.load(open(distant_supervision_labels_path))
     features = {}
-    #depending on which version of gensim you use
-    #model = gensim.models.KeyedVectors.load_word2vec_format(vectorsPath, binary=False)
-    model = gensim.models.Word2Vec.load_word2vec_format(vectorsPath, binary=False)
+    # memory-mapped store converted from the .vec file
+    model = vector_store.load(vectorsPath)
     idx = 0
     synsets_jumper = ["jumper", "cardigan", "hoodie", "sweatshirt", "jersey", "sweater", "pullover", "cardi"]
     synsets_tops = ["top", "tshirt", "polo", "vest", "sleeve", "shirt", "tee", "tank"]
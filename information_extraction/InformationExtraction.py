@@ -1,10 +1,8 @@
 # coding=utf-8
 # Author: Kim Hammar <kimham@kth.se> KTH 2018
 
-import gensim
 import json
 import urllib
-from nltk.metrics import edit_distance
 from nltk.stem import WordNetLemmatizer
 import math
 import lda
@@ -12,19 +10,23 @@ from sklearn.feature_extraction.text import CountVectorizer
 import numpy as np
 import re
 from collections import Counter
-import wikipedia
-from googlesearch.googlesearch import GoogleSearch
-from selenium import webdriver
-from bs4 import BeautifulSoup
 from deepomatic import Client
-from time import sleep
 from dd_client import DD
 import io
 import os
-from clarifai.rest import ClarifaiApp
-from clarifai.rest import Image as ClImage
-from google.cloud import vision
-from google.cloud.vision import types
+import threading
+import http_session
+import similarity_engine
+import gazetteer_index
+import vector_store
+import lru_cache
+import persistent_cache
+import lookup_pool
+import keyword_matcher
+import knowledge_client
+import liketkit_scraper
+import image_clients
+import deepomatic_tasks
 
 class InformationExtractor(object):
     """ Module with functions for information Extraction """
@@ -39,12 +41,18 @@ class InformationExtractor(object):
     nclasses_bags = 37
     nclasses_footwear = 51
     nclasses_fabric= 233
+    #DD services, named as the models in the configuration
+    sname_clothing = "clothing"
+    sname_bags = "bags"
+    sname_footwear = "footwear"
+    sname_fabric = "fabric"
 
     #setting up DD client
     mllib = 'caffe'
 
     def __init__(self, word_vectors, companies, styles, materials, items, probase_brands,
-                 probase_materials, patterns, top_category_items, deep_detectStartup, confFilePath, tfidf):
+                 probase_materials, patterns, top_category_items, deep_detectStartup, confFilePath, tfidf,
+                 startup_services=True):
         self.conf = json.load(open(confFilePath))
         self.tfidf = tfidf
         self.api_key = self.conf["google_api_key_path"]
@@ -54,9 +62,10 @@ class InformationExtractor(object):
         self.USERTAG_FACTOR = self.conf["usertag_factor"]
         self.HASHTAG_FACTOR = self.conf["hashtag_factor"]
         if deep_detectStartup:
-            self.dd = DD(self.conf["deep_detect_host"], port=self.conf["deep_detect_port"])
-            self.startup_deep_detect()
-        self.wordvec_model = gensim.models.KeyedVectors.load_word2vec_format(word_vectors, binary=False)
+            self.dd = DD(self.conf["deep_detect_host"], port=self.conf["deep_detect_port"], **self.http_settings())
+            if startup_services:
+                self.startup_deep_detect()
+        self.wordvec_model = vector_store.load(word_vectors)
         self.companies = companies
         self.styles = styles
         self.materials = materials
@@ -65,10 +74,78 @@ class InformationExtractor(object):
         self.materials_keywords_google = []
         self.probase_brands = probase_brands
         self.probase_materials = probase_materials
+        self.probase_brands_matcher = keyword_matcher.KeywordMatcher(probase_brands)
+        self.probase_materials_matcher = keyword_matcher.KeywordMatcher(probase_materials)
         self.colors = []
         self.patterns = patterns
         self.top_category_items=top_category_items
+        self.lemma_cache = lru_cache.LRUCache(self.conf.get("lemma_cache_size", 100000))
+        self.edit_distance_cache = lru_cache.LRUCache(self.conf.get("edit_distance_cache_size", 1000000))
+        self.probase_service_url = self.conf.get("probase_service_url", self.probase_service_url)
+        self.probase_offline = self.conf.get("probase_offline", False)
+        self.probase_cache = persistent_cache.PersistentCache(self.conf.get("probase_cache_path", ""),
+                                                              self.conf.get("probase_cache_ttl", None),
+                                                              self.conf.get("probase_negative_ttl", 3600))
+        if self.conf.get("probase_warm_file", "") != "":
+            self.probase_cache.warm(self.conf["probase_warm_file"])
+        self.deep_detect_batch_size = self.conf.get("deep_detect_batch_size", 32)
+        self.google_vision_batch_size = self.conf.get("google_vision_batch_size", image_clients.VISION_MAX_BATCH)
+        self.clarifai_batch_size = self.conf.get("clarifai_batch_size", image_clients.CLARIFAI_MAX_BATCH)
+        # Posts whose images are classified together, every service splits them into requests of its batch size
+        self.image_batch_size = self.conf.get("image_batch_size", self.deep_detect_batch_size)
+        self.lookups = lookup_pool.LookupPool(self.conf.get("lookup_timeouts", {}), self.conf.get("lookup_concurrency", {}))
+        self.session = http_session.session(**self.http_settings())
+        self.knowledge = knowledge_client.KnowledgeClient(
+            persistent_cache.PersistentCache(self.conf.get("knowledge_cache_path", ""),
+                                             self.conf.get("knowledge_cache_ttl", None),
+                                             self.conf.get("knowledge_negative_ttl", 3600)),
+            self.lookups, self.conf.get("knowledge_rate_limits", {}), self.session,
+            self.google_service_url, self.conf.get("knowledge_offline", False))
+        self.liketkit = self.liketkit_scraper()
+        self.deepomatic_tasks = None
         self.lemmatize()
+        self.gazetteer_index = gazetteer_index.load_or_build(self.conf.get("gazetteer_index_dir", "./cache"),
+                                                             self.wordvec_model.path, self.domain_lists(),
+                                                             self.wordnet_lemmatizer.lemmatize, self.topic_matrix)
+
+    def http_settings(self):
+        """ Connection pool size, retries and backoff of the HTTP clients of external services"""
+        return {"pool_size": self.conf.get("http_pool_size", http_session.DEFAULT_POOL_SIZE),
+                "retries": self.conf.get("http_retries", http_session.DEFAULT_RETRIES),
+                "backoff": self.conf.get("http_backoff", http_session.DEFAULT_BACKOFF)}
+
+    def liketkit_scraper(self):
+        """ Scraper of liketk.it links, with a pool of liketkit_browser_pool_size browsers for pages that need them"""
+        timeout = self.conf.get("liketkit_timeout", liketkit_scraper.DEFAULT_TIMEOUT)
+        browsers = None
+        if self.conf.get("liketkit_browser_pool_size", 0) > 0:
+            browsers = liketkit_scraper.BrowserPool(self.conf["liketkit_browser_pool_size"], timeout)
+        return liketkit_scraper.LiketkitScraper(
+            liketkit_scraper.HttpFetcher(self.session, timeout), browsers,
+            persistent_cache.PersistentCache(self.conf.get("liketkit_cache_path", ""),
+                                             self.conf.get("liketkit_cache_ttl", None),
+                                             self.conf.get("liketkit_negative_ttl", 3600)),
+            self.lookups, self.conf.get("liketkit_max_products", liketkit_scraper.DEFAULT_MAX_PRODUCTS))
+
+    def deepomatic_client(self):
+        """ Deepomatic client shared by all lookups of the process, so that its connections are reused"""
+        settings = self.http_settings()
+        key = (self.conf["deepomatic_api_key"], settings["pool_size"], settings["retries"], settings["backoff"])
+        with deepomatic_clients_lock:
+            if key not in deepomatic_clients:
+                deepomatic_clients[key] = Client(529372386976, self.conf["deepomatic_api_key"], **settings)
+            return deepomatic_clients[key]
+
+    def deepomatic_task_manager(self):
+        """ Task manager of the Deepomatic detections, created on first use"""
+        if self.deepomatic_tasks is None:
+            self.deepomatic_tasks = deepomatic_tasks.TaskManager(
+                self.deepomatic_client(),
+                self.conf.get("deepomatic_poll_interval", deepomatic_tasks.DEFAULT_POLL_INTERVAL),
+                self.conf.get("deepomatic_max_poll_interval", deepomatic_tasks.DEFAULT_MAX_POLL_INTERVAL),
+                self.conf.get("deepomatic_deadline", deepomatic_tasks.DEFAULT_DEADLINE),
+                self.conf.get("deepomatic_max_in_flight", deepomatic_tasks.DEFAULT_MAX_IN_FLIGHT))
+        return self.deepomatic_tasks
 
     def lemmatize(self):
         """ Lemmatize domain lists"""
@@ -76,77 +153,151 @@ class InformationExtractor(object):
         self.materials_lemmas = {self.wordnet_lemmatizer.lemmatize(material): material for material in self.materials}
         self.items_lemmas = {self.wordnet_lemmatizer.lemmatize(item): item for item in self.items}
 
+    def lemma(self, word):
+        """ Lemma of a word, memoized"""
+        return self.lemma_cache.get(word, self.wordnet_lemmatizer.lemmatize, word)
+
+    def edit_distance(self, word1, word2):
+        """ Edit distance between two words, memoized"""
+        return self.edit_distance_cache.get((word1, word2), similarity_engine.edit_distance, word1, word2)
+
+    def cache_stats(self):
+        """ Hit/miss counters of the lemma and edit distance caches"""
+        return {"lemma": self.lemma_cache.stats(), "edit_distance": self.edit_distance_cache.stats()}
+
+    def domain_lists(self):
+        """ Domain lists to compile into the gazetteer index, name -> (domain list, hierarchical)"""
+        return {
+            "brands": (self.companies, False),
+            "styles": (self.styles, True),
+            "materials": (self.materials_lemmas.keys(), False),
+            "item-sub-category": (self.items_lemmas.keys(), False),
+            "patterns": (self.patterns, False),
+            "item-category": (self.top_category_items, True)
+        }
+
+    def gazetteer(self, topic, hierarchical):
+        """ Compiled gazetteer of a domain list, lists that are not in the index are compiled on first use"""
+        gazetteer = self.gazetteer_index.lookup(topic, hierarchical)
+        if gazetteer is None:
+            gazetteer = gazetteer_index.compile_gazetteer(topic, hierarchical, self.wordnet_lemmatizer.lemmatize,
+                                                          self.topic_matrix)
+            self.gazetteer_index.add(topic, gazetteer)
+        return gazetteer
+
     def find_closest_semantic(self, caption, comments, tags, hashtags, segmented_hashtags, num, topic, id):
         """ Finds num semantically closest candidates for a given topic"""
-        topic = map(lambda x: x.decode('utf-8','ignore').encode("utf-8"), topic)
-        freq_scores = {}
-        for x in topic:
-            freq_scores[x] = 0.0
-        for token in caption:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity(token, token2, token2Lemma, self.CAPTION_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in comments:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity(token, token2, token2Lemma, self.COMMENTS_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in hashtags:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity(token, token2, token2Lemma, self.HASHTAG_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in segmented_hashtags:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity(token, token2, token2Lemma, self.HASHTAG_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in tags:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity(token, token2, token2Lemma, self.USERTAG_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
+        fields = self.post_fields(caption, comments, hashtags, segmented_hashtags, tags)
+        return self.find_closest(fields, topic, id, num, similarity_engine.SEMANTIC, False)
+
+    def post_fields(self, caption, comments, hashtags, segmented_hashtags, tags):
+        """ Token lists of a post with their weighting factors, user tags last"""
+        return [(caption, self.CAPTION_FACTOR), (comments, self.COMMENTS_FACTOR), (hashtags, self.HASHTAG_FACTOR),
+                (segmented_hashtags, self.HASHTAG_FACTOR), (tags, self.USERTAG_FACTOR)]
+
+    def find_closest(self, fields, topic, id, num, strategy, hierarchical):
+        """
+        Finds num closest candidates (entries, or labels of a hierarchical topic) for a given topic,
+        the tokens of all fields are scored in one pass with the given strategy (semantic or syntactic)
+        """
+        gazetteer = self.gazetteer(topic, hierarchical)
+        tokens = self.token_matrix(fields, self.post_tfidf(id), strategy.embeddings)
+        return self.closest(tokens, gazetteer, strategy, num)
+
+    def closest(self, tokens, gazetteer, strategy, num):
+        """ Top num candidates of a compiled gazetteer for the tokens of a post"""
+        if gazetteer.hierarchical():
+            scores = similarity_engine.hierarchical_scores(tokens, gazetteer.matrix, strategy, gazetteer.label_starts())
+            freq_scores = similarity_engine.scatter_add(gazetteer.labels, scores)
+        else:
+            scores = similarity_engine.flat_scores(tokens, gazetteer.matrix, strategy, num)
+            freq_scores = similarity_engine.scatter_add(gazetteer.entries, scores)
         top = sorted([(k, v) for k, v in freq_scores.iteritems()], reverse=True, key=lambda x: x[1])[:num]
         return top
 
+    def classify_post(self, caption, comments, tags, hashtags, segmented_hashtags, userhandles, id, num=10):
+        """
+        Semantic text clustering of a post against all domain lists. The tokens of the post are lemmatized, embedded
+        and weighted once and scored against the six gazetteers, brands are also matched against the user handles.
+        Returns the candidates and scores per attribute, with brands and materials re-ranked with probase
+        """
+        fields = self.post_fields(caption + userhandles, comments, hashtags, segmented_hashtags, tags)
+        post_tokens = self.token_matrix(fields, self.post_tfidf(id), True)
+        without_handles = np.ones(len(post_tokens), dtype=bool)
+        without_handles[len(caption):len(caption) + len(userhandles)] = False
+        tokens = post_tokens.rows(without_handles)
+        classes = {}
+        for name in self.domain_lists():
+            if name == "brands":
+                top = self.closest(post_tokens, self.gazetteer_index[name], similarity_engine.SEMANTIC, num)
+            else:
+                top = self.closest(tokens, self.gazetteer_index[name], similarity_engine.SEMANTIC, num)
+            classes[name] = top
+        classes["brands"] = self.re_rank_probase(classes["brands"], self.rank_probase_result_company, 10)
+        classes["materials"] = self.re_rank_probase(classes["materials"], self.rank_probase_result_material, 10)
+        return {name: dict(top) for name, top in classes.iteritems()}
+
+    def re_rank_probase(self, candidates, rank_result, num):
+        """ Re-rank candidates by multiplying their scores with the rank of their top num probase concepts"""
+        ranked = []
+        for candidate, score in candidates:
+            result = self.lookup_probase({'instance': candidate, 'topK': num})
+            ranked.append((candidate, score * rank_result(result)))
+        return ranked
+
+    def vocab_row(self, word):
+        """ Row of a word in the word vectors, -1 if the word has no embedding"""
+        return self.wordvec_model.row(word)
+
+    def embeddings(self, words, ids):
+        """ Unit-normalized embeddings of words, zero rows for words without embedding"""
+        dim = self.wordvec_model.vector_size
+        vectors = np.zeros((len(words), dim), dtype=np.float32)
+        vectors[ids >= 0] = self.wordvec_model.vectors[ids[ids >= 0]]
+        return similarity_engine.unit_vectors(vectors, dim)
+
+    def post_tfidf(self, id):
+        """ TF-IDF weights of the tokens of a post, self.tfidf is a dict or a Spark broadcast of a dict"""
+        if hasattr(self.tfidf, "value"):
+            return self.tfidf.value[id]
+        return self.tfidf[id]
+
+    def token_matrix(self, fields, tfidf, embeddings):
+        """
+        Lemmas, TF-IDF weights and factors of the tokens of all fields of a post, for vectorized scoring.
+        With embeddings, tokens are decoded to unicode and their embeddings are looked up.
+        """
+        tokens = [token for field, factor in fields for token in field]
+        factors = np.array([factor for field, factor in fields for token in field], dtype=np.float64)
+        tags = np.arange(len(tokens)) >= len(tokens) - len(fields[-1][0])
+        ids = None
+        vectors = None
+        if embeddings:
+            tokens = map(lambda x: x.decode("utf-8", "ignore") if isinstance(x, str) else x, tokens)
+        lemmas = map(self.lemma, tokens)
+        if embeddings:
+            ids = np.array(map(self.vocab_row, lemmas), dtype=np.int64)
+            vectors = self.embeddings(lemmas, ids)
+        weights = np.array(map(lambda x: similarity_engine.tfidf_weight(x, tfidf), tokens), dtype=np.float64)
+        return similarity_engine.TokenMatrix(lemmas, ids, vectors, weights, factors, tags)
+
+    def topic_matrix(self, lemmas):
+        """ Embeddings and encoded characters of topic lemmas, for vectorized scoring"""
+        ids = np.array(map(self.vocab_row, lemmas), dtype=np.int64)
+        return similarity_engine.TopicMatrix(lemmas, ids, self.embeddings(lemmas, ids))
+
     def token_similarity(self, token, token2, token2Lemma, factor, tfidf):
         """ Returns similarity between two tokens using cosine similarity between embeddings, edit distance and TFIDF weighting"""
         similarity = 0.0
         if isinstance(token, str):
             token = token.decode("utf-8", "ignore")
-        tokenLemma = self.wordnet_lemmatizer.lemmatize(token)
+        tokenLemma = self.lemma(token)
         if tokenLemma in self.wordvec_model.wv.vocab and token2Lemma in self.wordvec_model.wv.vocab:
-            if edit_distance(tokenLemma, token2Lemma) == 0:
+            if self.edit_distance(tokenLemma, token2Lemma) == 0:
                 factor = factor*10
             similarity = factor*math.pow(float(self.wordvec_model.wv.similarity(tokenLemma, token2Lemma)), 2)
         else:
-            dist = factor*edit_distance(tokenLemma, token2Lemma)
+            dist = factor*self.edit_distance(tokenLemma, token2Lemma)
             similarity = float(1)/float(1 + math.pow(dist, 2))
         tfidf_score = 0.0
         if token in tfidf:
@@ -159,70 +310,16 @@ class InformationExtractor(object):
 
     def find_closest_syntactic(self, caption, comments, tags, hashtags, segmented_hashtags, num, topic, id):
         """ Finds num semantically closest candidates for a given topic"""
-        topic = map(lambda x: x.decode('utf-8','ignore').encode("utf-8"), topic)
-        freq_scores = {}
-        for x in topic:
-            freq_scores[x] = 0.0
-        for token in caption:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.CAPTION_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in comments:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.COMMENTS_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in hashtags:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.HASHTAG_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in segmented_hashtags:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.HASHTAG_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        for token in tags:
-            scores = []
-            for x in topic:
-                token2 = x.lower()
-                token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.USERTAG_FACTOR, self.tfidf[id])
-                scores.append((x, similarity))
-            top = sorted(scores, reverse=True, key=lambda x: x[1])[:num]
-            for x in top:
-                freq_scores[x[0]] = freq_scores[x[0]] + x[1]
-        top = sorted([(k, v) for k, v in freq_scores.iteritems()], reverse=True, key=lambda x: x[1])[:num]
-        return top
+        fields = self.post_fields(caption, comments, hashtags, segmented_hashtags, tags)
+        return self.find_closest(fields, topic, id, num, similarity_engine.SYNTACTIC, False)
 
     def token_similarity_syntactic_only(self, token, token2, token2Lemma, factor, tfidf):
         """ Returns similarity between two tokens using edit distance and TFIDF weighting"""
-        tokenLemma = self.wordnet_lemmatizer.lemmatize(token)
+        tokenLemma = self.lemma(token)
         similarity = 0.0
-        if edit_distance(tokenLemma, token2Lemma) == 0:
+        dist = self.edit_distance(tokenLemma, token2Lemma)
+        if dist == 0:
             factor = factor*10
-        dist = edit_distance(tokenLemma, token2Lemma)
         similarity = factor*(float(1)/float(1 + dist))
         tfidf_score = 0.0
         if token in tfidf:
@@ -235,70 +332,85 @@ class InformationExtractor(object):
 
 
     def lookup_google(self, params):
-        """ Lookup in Google Search"""
+        """ Lookup in Google Knowledge Graph, cached"""
         #curl "https://kgsearch.googleapis.com/v1/entities:search?query=bebe&key=<key>&limit=2&indent=True&types=Organization"
-        url = self.google_service_url + '?' + urllib.urlencode(params)
         #result score = an indicator of how well the entity matched the request constraints.
-        response = json.loads(urllib.urlopen(url).read())
-        results = []
-        if "itemListElement" in response:
-            for element in response['itemListElement']:
-                dict_result = {}
-                if "resultScore" in element:
-                    dict_result["resultScore"] = element['resultScore']
-                if "result" in element:
-                    if "detailedDescription" in element["result"]:
-                        dict_result["detailedDescription"] = element["result"]['detailedDescription']
-                    if "description" in element["result"]:
-                        dict_result["description"] = element["result"]['description']
-                    if "url" in element["result"]:
-                        dict_result["url"] = element["result"]["url"]
-                results.append(dict_result)
+        results = self.knowledge.google_kg(params)
+        if results is None:
+            return []
         return results
 
+    @property
+    def brands_keywords_google(self):
+        """ Keywords of brands in Google results, brands_google_matcher is compiled when they are assigned"""
+        return self._brands_keywords_google
+
+    @brands_keywords_google.setter
+    def brands_keywords_google(self, keywords):
+        self._brands_keywords_google = keywords
+        self.brands_google_matcher = keyword_matcher.KeywordMatcher(keywords)
+
+    @property
+    def materials_keywords_google(self):
+        """ Keywords of materials in Google results, materials_google_matcher is compiled when they are assigned"""
+        return self._materials_keywords_google
+
+    @materials_keywords_google.setter
+    def materials_keywords_google(self, keywords):
+        self._materials_keywords_google = keywords
+        self.materials_google_matcher = keyword_matcher.KeywordMatcher(keywords)
+
     def rank_google_result_company(self, results):
         """ Binary rank  of google search results"""
-        for result in results:
-            for keyword in self.brands_keywords_google:
-                if "detailedDescription" in result:
-                    if keyword in result["detailedDescription"]:
-                        return 1
-                if "description" in result:
-                    if keyword in result["description"]:
-                        return 1
-        return 0.0
+        return self.rank_google_result(results, self.brands_google_matcher)
 
     def rank_google_result_material(self, results):
         """ Binary rank  of google search results"""
+        return self.rank_google_result(results, self.materials_google_matcher)
+
+    def rank_google_result(self, results, matcher):
+        """ 1 if the description of a result contains a keyword of the matcher, else 0.0"""
         for result in results:
-            for keyword in self.materials_keywords_google:
-                if keyword in result["detailedDescription"] or keyword in result["description"]:
-                    return 1
+            if matcher.matches(result.get("detailedDescription", "")) or matcher.matches(result.get("description", "")):
+                return 1
         return 0.0
 
     def rank_probase_result_company(self, result):
         """Probase probability ranking [0,1]"""
-        keywords = filter(lambda x: x in result, self.probase_brands)
-        keywords = map(lambda x: result[x], keywords)
-        if len(keywords) > 0:
-            return 1 + max(keywords)
-        else:
-            return 0.5
+        return self.rank_probase_result(result, self.probase_brands_matcher)
 
     def rank_probase_result_material(self, result):
         """Probase probability ranking [0,1]"""
-        keywords = filter(lambda x: x in result, self.probase_materials)
-        keywords = map(lambda x: result[x], keywords)
+        return self.rank_probase_result(result, self.probase_materials_matcher)
+
+    def rank_probase_result(self, result, matcher):
+        """ 1 + the highest probability of the concepts of the result that are keywords of the matcher, else 0.5"""
+        keywords = map(lambda x: result[x], matcher.exact_matches(result))
         if len(keywords) > 0:
             return 1 + max(keywords)
         else:
             return 0.5
 
     def lookup_probase(self, params):
-        """Probase lookup"""
+        """Probase lookup, cached on disk. Failed lookups (and misses when offline) give an empty result"""
         #curl "https://concept.research.microsoft.com/api/Concept/ScoreByProb?instance=adidas&topK=10"
+        key = json.dumps(params, sort_keys=True)
+        cached = self.probase_cache.get(key)
+        if cached is not None:
+            ok, response = cached
+            if ok:
+                return response
+            return {}
+        if self.probase_offline:
+            return {}
         url = self.probase_service_url + '?' + urllib.urlencode(params)
-        response = json.loads(urllib.urlopen(url).read())
+        try:
+            response = json.loads(urllib.urlopen(url).read())
+        except (IOError, ValueError):
+            print("error in probase lookup: {0}".format(key))
+            self.probase_cache.put_failure(key)
+            return {}
+        self.probase_cache.put(key, response)
         return response
 
     def get_liketoknowitlinks(self, tokens):
@@ -336,31 +448,11 @@ class InformationExtractor(object):
 
     def get_wikipedia_vote(self, query):
         """ Wikipedia lookup binary rank"""
-        pages = wikipedia.search(query)
-        for pageName in pages:
-            try:
-                page = wikipedia.page(pageName)
-                content = page.content.lower()
-                for keyword in self.brands_keywords_google:
-                    if keyword in content:
-                        return 1
-            except:
-                return 0.0
-        return 0.0
+        return self.knowledge.wikipedia_vote(query, self.brands_google_matcher)
 
     def get_google_search_vote(self, query):
         """ Google search lookup binary rank"""
-        try:
-            response = GoogleSearch().search(query)
-            for result in response.results:
-                text = result.getText().lower()
-                title  = result.title.lower()
-                for keyword in self.brands_keywords_google:
-                    if keyword in text or keyword in title:
-                        return 1
-        except:
-            return 0
-        return 0
+        return self.knowledge.google_search_vote(query, self.brands_google_matcher)
 
     def emoji_classification(self, emojis,num):
         """ Emoji classification """
@@ -417,7 +509,7 @@ class InformationExtractor(object):
                 scores = []
                 for word in words:
                     token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
+                    token2Lemma = self.lemma(token2)
                     similarity = self.token_similarity(token[0], token2, token2Lemma, self.CAPTION_FACTOR)
                     scores.append(similarity*math.pow(token[1],2))
 
@@ -426,108 +518,81 @@ class InformationExtractor(object):
         return freq_scores
 
     def liketkit_classification(self, url):
-        """ Liketkit link scraping """
-        text = []
-        try:
-            driver = webdriver.PhantomJS()
-            driver.get(url)
-            p_element = driver.find_element_by_class_name("ltk-products")
-            products = p_element.find_elements_by_xpath(".//*")
-            urls = []
-            for prod in products:
-                urls.append(prod.get_attribute("href"))
-            for url in urls:
-                driver.get(url)
-                html = driver.page_source
-                soup = BeautifulSoup(html, "lxml")
-                data = soup.findAll(text=True, recursive=True)
-                text.extend(list(data))
-                return text
-        except:
-            print("error in liketkit classification")
-            return text
+        """ Liketkit link scraping, the text of the product pages of the link"""
+        return self.liketkit.scrape(url)
 
     def google_vision_lookup(self, imagePath):
         """ Google vision API lookup """
-        item_candidates = []
-        try:
-            # Instantiates a client
-            client = vision.ImageAnnotatorClient()
+        return self.google_vision_lookup_batch([imagePath])[0]
 
+    def google_vision_lookup_batch(self, imagePaths):
+        """ Google vision API lookup of a batch of images, with google_vision_batch_size images per request"""
+        contents = []
+        for imagePath in imagePaths:
             # The name of the image file to annotate
-            file_name = os.path.join(
-                os.path.dirname(__file__),
-                imagePath)
-
-            # Loads the image into memory
-            with io.open(file_name, 'rb') as image_file:
-                content = image_file.read()
-
-            image = types.Image(content=content)
-
-            # Performs label detection on the image file
-            response = client.label_detection(image=image)
-            labels = response.label_annotations
-            for label in labels:
-                item_candidates.append((label.description, label.score))
-            return item_candidates
-        except:
-            print("error in google_vision_LF")
-            return item_candidates
+            file_name = os.path.join(os.path.dirname(__file__), imagePath)
+            try:
+                with io.open(file_name, 'rb') as image_file:
+                    contents.append(image_file.read())
+            except IOError:
+                print("error in google_vision_LF, cannot read {0}".format(file_name))
+                contents.append(None)
+        return image_clients.vision_labels(image_clients.vision_client(), contents, self.google_vision_batch_size)
 
     def deep_detect_lookup(self, link):
         """ Deep detect local lookup"""
-        items_and_fabrics = {}
-        items_and_fabrics["items"] = []
-        items_and_fabrics["fabrics"] = []
+        return self.deep_detect_lookup_batch([link])[0]
+
+    def deep_detect_lookup_batch(self, links):
+        """
+        Deep detect local lookup of a batch of images, with deep_detect_batch_size images per request.
+        Returns the items and fabrics of every link
+        """
+        results = [{"items": [], "fabrics": []} for link in links]
+        for start in range(0, len(links), self.deep_detect_batch_size):
+            chunk = links[start:start + self.deep_detect_batch_size]
+            self.deep_detect_predict(chunk, results[start:start + len(chunk)])
+        return results
+
+    def deep_detect_predict(self, links, results):
+        """
+        Predicts a batch of images with the clothing, bags, footwear and fabric models (queried concurrently)
+        and adds the predictions of every image to its result, in that order
+        """
+        parameters_input = {}
+        parameters_mllib = {}
+        parameters_output = {'best':10}
+        # (service, result list, weight of the probabilities)
+        services = [(self.sname_clothing, "items", 1.0), (self.sname_bags, "items", 0.5),
+                    (self.sname_footwear, "items", 0.5), (self.sname_fabric, "fabrics", 1.0)]
         try:
-            parameters_input = {}
-            parameters_mllib = {}
-            parameters_output = {'best':10}
-            data = [link]
-            clothing_res = self.dd.post_predict(self.sname_clothing,data,parameters_input,parameters_mllib,parameters_output)
-            body = clothing_res[u"body"]
-            predictions = body[u"predictions"]
-            classes = predictions[0][u"classes"]
-            for c in classes:
-                items = c[u"cat"].strip(" ").split(",")
-                prob = c[u"prob"]
-                for item in items:
-                    items_and_fabrics["items"].append((item, prob))
-
-            bags_res = self.dd.post_predict(self.sname_bags,data,parameters_input,parameters_mllib,parameters_output)
-            body = bags_res[u"body"]
-            predictions = body[u"predictions"]
-            classes = predictions[0][u"classes"]
-            for c in classes:
-                items = c[u"cat"].strip(" ").split(",")
-                prob = c[u"prob"]
-                for item in items:
-                    items_and_fabrics["items"].append((item, 0.5*prob))
-
-            footwear_res = self.dd.post_predict(self.sname_footwear,data,parameters_input,parameters_mllib,parameters_output)
-            body = footwear_res[u"body"]
-            predictions = body[u"predictions"]
-            classes = predictions[0][u"classes"]
-            for c in classes:
-                items = c[u"cat"].strip(" ").split(",")
-                prob = c[u"prob"]
-                for item in items:
-                    items_and_fabrics["items"].append((item, 0.5*prob))
-
-            fabric_res = self.dd.post_predict(self.sname_fabric,data,parameters_input,parameters_mllib,parameters_output)
-            body = fabric_res[u"body"]
-            predictions = body[u"predictions"]
-            classes = predictions[0][u"classes"]
-            for c in classes:
-                items = c[u"cat"].strip(" ").split(",")
-                prob = c[u"prob"]
-                for item in items:
-                    items_and_fabrics["fabrics"].append((item, prob))
-            return items_and_fabrics
+            lookups = map(lambda service: self.lookups.submit("deepdetect_model", self.dd.post_predict, service[0],
+                                                              list(links), parameters_input, parameters_mllib,
+                                                              parameters_output),
+                          services)
         except:
             print("error in deep_detect_LF")
-            return items_and_fabrics
+            return
+        service_predictions = []
+        for lookup in lookups:
+            try:
+                body = lookup.result()[u"body"]
+                service_predictions.append(demux_predictions(links, body[u"predictions"]))
+            except:
+                print("error in deep_detect_LF")
+                service_predictions.append([None] * len(links))
+        for i, items_and_fabrics in enumerate(results):
+            try:
+                for (sname, key, weight), predictions in zip(services, service_predictions):
+                    classes = predictions[i][u"classes"]
+                    for c in classes:
+                        items = c[u"cat"].strip(" ").split(",")
+                        prob = c[u"prob"]
+                        for item in items:
+                            items_and_fabrics[key].append((item, weight*prob))
+            except:
+                # Like a single lookup, the predictions after the first failed model are not used
+                pass
 
     def startup_deep_detect(self):
         """ Startup services for deep detect classification """
@@ -542,189 +607,93 @@ class InformationExtractor(object):
 
     def deepomatic_lookup(self, link):
         """ Deepomatic API lookup """
-        item_candidates = []
-        try:
-            client = Client(529372386976, self.conf["deepomatic_api_key"])
-            task = client.helper.get("/detect/fashion/?url=" + link)
-            taskid = task[u"task_id"]
-            i = 0
-            while i < 10:
-                sleep(0.1) #100ms
-                res = client.helper.get("/tasks/" + str(taskid) + "/")
-                task = res[u"task"]
-                status = task[u"status"]
-                if status == u"success" or status == "success":
-                    data = task[u"data"]
-                    boxes = data[u"boxes"]
-                    for item in boxes.keys():
-                        info = boxes[item]
-                        probability = 0.0
-                        for inf in info:
-                            probability = probability + inf[u"proba"]
-                        item_candidates.append((item.encode("utf-8"), probability))
-                    i = 10
-                else:
-                    i += 1
-            return item_candidates
-        except:
-            print("error in deepomaticLF")
-            return item_candidates
+        return self.deepomatic_lookup_batch([link])[0]
+
+    def deepomatic_lookup_batch(self, links):
+        """ Deepomatic API lookup of a batch of images, with up to deepomatic_max_in_flight tasks in flight"""
+        return self.deepomatic_task_manager().detect_all(links)
 
     def clarifai_lookup(self, link):
         """ Clarifai API lookup"""
-        item_candidates = []
-        try:
-            app = ClarifaiApp(api_key=self.conf["clarifai_api_key"])
-            model = app.models.get('apparel')
-            image = ClImage(url=link)
-            res = model.predict([image])
-            outputs = res[u"outputs"]
-            for output in outputs:
-                data = output[u"data"]
-                concepts = data[u"concepts"]
-                for concept in concepts:
-                    concept_parts = concept[u"name"].encode("utf-8").split(" ")
-                    val = concept[u"value"]
-                    for part in concept_parts:
-                        item_candidates.append((part, val))
-
-            return item_candidates
-        except:
-            print("error in clarifai LF")
-            return item_candidates
+        return self.clarifai_lookup_batch([link])[0]
+
+    def clarifai_lookup_batch(self, links):
+        """ Clarifai API lookup of a batch of images, with clarifai_batch_size images per request"""
+        return image_clients.clarifai_concepts(image_clients.clarifai_model(self.conf["clarifai_api_key"]), links,
+                                               self.clarifai_batch_size)
 
     def find_closest_semantic_hierarchy(self, caption, comments, tags, hashtags, topic, id, num):
         """ Finds num semantically closest candidates for a given topic with multiple words per topic"""
-        topic = map(lambda x: x.decode('utf-8','ignore').encode("utf-8"), topic)
-        freq_scores = {}
-        for x in topic:
-            parts = x.split(",")
-            label = parts[0]
-            freq_scores[label] = 0.0
-        for token in caption:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity(token, token2, token2Lemma, self.CAPTION_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        for token in comments:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity(token, token2, token2Lemma, self.COMMENTS_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        for token in hashtags:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity(token, token2, token2Lemma, self.HASHTAG_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        for token in tags:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity(token, token2, token2Lemma, self.USERTAG_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                    acc_sim = acc_sim + similarity
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        top = sorted([(k, v) for k, v in freq_scores.iteritems()], reverse=True, key=lambda x: x[1])[:num]
-        return top
+        fields = self.post_fields(caption, comments, hashtags, [], tags)
+        return self.find_closest(fields, topic, id, num, similarity_engine.SEMANTIC, True)
 
     def find_closest_syntactic_hierarchy(self, caption, comments, tags, hashtags,topic,id,num):
         """ Finds num syntactically closest candidates for a given topic, with multiple words per topic"""
-        topic = map(lambda x: x.decode('utf-8','ignore').encode("utf-8"), topic)
-        freq_scores = {}
-        for x in topic:
-            parts = x.split(",")
-            label = parts[0]
-            freq_scores[label] = 0.0
-        for token in caption:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.CAPTION_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        for token in comments:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.COMMENTS_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        for token in hashtags:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.HASHTAG_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        for token in tags:
-            for x in topic:
-                parts = x.split(",")
-                label = parts[0]
-                words = parts[1].split(" ")
-                acc_sim = 0
-                scores = []
-                for word in words:
-                    token2 = word.lower()
-                    token2Lemma = self.wordnet_lemmatizer.lemmatize(token2)
-                    similarity = self.token_similarity_syntactic_only(token, token2, token2Lemma, self.USERTAG_FACTOR, self.tfidf[id])
-                    scores.append(similarity)
-                    acc_sim = acc_sim + similarity
-                acc_sim = acc_sim + max(scores)
-                freq_scores[label] = freq_scores[label] + acc_sim
-        top = sorted([(k, v) for k, v in freq_scores.iteritems()], reverse=True, key=lambda x: x[1])[:num]
-        return top
+        fields = self.post_fields(caption, comments, hashtags, [], tags)
+        return self.find_closest(fields, topic, id, num, similarity_engine.SYNTACTIC, True)
+
+
+class ExtractorConfig(object):
+    """
+    Picklable arguments of an InformationExtractor, shipped to Spark tasks instead of the extractor itself.
+    The extractor is created once per process (Spark executor) on first use, tfidf is a dict or a Spark broadcast
+    of the TF-IDF weights per post id
+    """
+
+    def __init__(self, word_vectors, companies, styles, materials, items, probase_brands,
+                 probase_materials, patterns, top_category_items, deep_detect, confFilePath, tfidf):
+        self.word_vectors = word_vectors
+        self.companies = companies
+        self.styles = styles
+        self.materials = materials
+        self.items = items
+        self.probase_brands = probase_brands
+        self.probase_materials = probase_materials
+        self.patterns = patterns
+        self.top_category_items = top_category_items
+        self.deep_detect = deep_detect
+        self.confFilePath = confFilePath
+        self.tfidf = tfidf
+
+    def key(self):
+        """ Identifies the extractor of this config in the process, broadcasts by their id"""
+        tfidf_key = self.tfidf.bid if hasattr(self.tfidf, "bid") else id(self.tfidf)
+        return (self.word_vectors, self.confFilePath, self.deep_detect, tfidf_key)
+
+    def create(self, startup_services=False):
+        """ New InformationExtractor, startup_services to start the DeepDetect services (once, on the driver)"""
+        return InformationExtractor(self.word_vectors, self.companies, self.styles, self.materials, self.items,
+                                    self.probase_brands, self.probase_materials, self.patterns,
+                                    self.top_category_items, self.deep_detect, self.confFilePath, self.tfidf,
+                                    startup_services)
+
+    def extractor(self):
+        """ The InformationExtractor of this config in the current process, created on first use"""
+        with extractors_lock:
+            if self.key() not in extractors:
+                extractors[self.key()] = self.create()
+            return extractors[self.key()]
+
+
+# InformationExtractors of the process (e.g. a Spark executor), by ExtractorConfig key
+extractors = {}
+extractors_lock = threading.Lock()
+
+# Deepomatic clients of the process (e.g. a Spark executor), by API key and HTTP settings
+deepomatic_clients = {}
+deepomatic_clients_lock = threading.Lock()
+
+
+def demux_predictions(links, predictions):
+    """
+    Predictions of a DeepDetect batch per link, matched on the uri of the predictions (their order is not guaranteed)
+    or on their position when they have no uri. None for links without prediction
+    """
+    if all(u"uri" in prediction for prediction in predictions):
+        by_uri = {}
+        for prediction in predictions:
+            by_uri[prediction[u"uri"]] = prediction
+        return [by_uri.get(link) for link in links]
+    if len(predictions) == len(links):
+        return list(predictions)
+    return [None] * len(links)
@@ -4,16 +4,29 @@ from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import TweetTokenizer
 from nltk.tag.perceptron import PerceptronTagger
+from collections import deque
+from itertools import islice, izip
+from multiprocessing import Pool
+import time
 import nltk
 import emoji
+import lru_cache
 nltk.download('averaged_perceptron_tagger')
 nltk.download('stopwords')
 nltk.download('wordnet')
 
+DEFAULT_LEMMA_CACHE_SIZE = 100000
+DEFAULT_CHUNK_SIZE = 1000
+
+
 class PreProcessor(object):
     """
     Preprocessor module in the Information Extraction Process of Fashion Related Properties of Instagram posts.
     Performs text normalization and parsing.
+
+    PreProcessor(ids, comments, captions, tags) normalizes all posts up front into parallel lists (raw_*, tokens_*,
+    lemma_*, emojis, hashtags, and pos_tokens with pos=True), for small inputs. PreProcessor.stream yields one
+    normalized post at a time instead, optionally normalized in a pool of processes, for large corpora.
     """
 
     # Class variables shared by all instances
@@ -22,73 +35,106 @@ class PreProcessor(object):
     stop_words = set(stopwords.words('english'))
     stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
     tagger = PerceptronTagger()
+    # Lemmas of the distinct tokens, per process
+    lemma_cache = lru_cache.LRUCache(DEFAULT_LEMMA_CACHE_SIZE)
 
-    def __init__(self, ids, comments, captions, tags):
+    def __init__(self, ids, comments, captions, tags, processes=1, pos=False):
         """ Class Constructor"""
-
-        # Raw text
-        self.raw_id = ids
-        self.raw_comments = comments
-        self.raw_captions = captions
-        self.raw_tags = tags
-        print("Read in Raw Text")
-
-        # Preprocess raw text
-        self.remove_non_unicode()
-        self.lower_case()
-        self.to_unicode()
-        print("Normalized Raw Text")
-
-        # Tokenize and preprocess tokens
-        self.tokenize()
-        print("Tokenized the text")
-        self.remove_stopwords()
-        #self.remove_urls()
-        print("Normalized tokens")
-
-        # Extract specific tokens
-        self.lemmatize()
-        print("Extracted lemmas")
-        self.extract_emojis()
-        print("Extracted emojis")
-        self.extract_hashtags()
-        print("Extracted hashtags")
-        #self.pos_tag()
-        #print("Extracted POS")
-
-    def remove_non_unicode(self):
-        """ Remove non-unicode tokens"""
-        self.raw_comments = map(lambda x: x.decode('utf-8','ignore').encode("utf-8"), self.raw_comments)
-        self.raw_captions = map(lambda x: x.decode('utf-8', 'ignore').encode("utf-8"), self.raw_captions)
-        self.raw_tags = map(lambda x: x.decode('utf-8','ignore').encode("utf-8"), self.raw_tags)
-
-    def to_unicode(self):
-        """ Convert text to unicode """
-        self.raw_comments = map(lambda x: x.decode('utf-8'), self.raw_comments)
-        self.raw_captions = map(lambda x: x.decode('utf-8'), self.raw_captions)
-        self.raw_tags = map(lambda x: x.decode('utf-8'), self.raw_tags)
-
-    def tokenize(self):
-        """ Tokenize text with TweetTokenizer, preserve emojis, hashtags etc """
-        self.tokens_captions = [self.tknzr.tokenize(caption) for caption in self.raw_captions]
-        self.tokens_comments = [self.tknzr.tokenize(comment) for comment in self.raw_comments]
-        self.tokens_tags = [self.tknzr.tokenize(tag) for tag in self.raw_tags]
+        self.raw_id = []
+        self.raw_comments = []
+        self.raw_captions = []
+        self.raw_tags = []
+        self.tokens_comments = []
+        self.tokens_captions = []
+        self.tokens_tags = []
         self.tokens_all = []
-        for i in range(len(self.raw_id)):
-            self.tokens_all.append(self.tokens_captions[i] + self.tokens_comments[i] + self.tokens_tags[i])
-
-    def lower_case(self):
-        """ Convert raw text into lowercase"""
-        self.raw_captions = [caption.lower() for caption in self.raw_captions]
-        self.raw_comments = [comments.lower() for comments in self.raw_comments]
-        self.raw_tags = [tags.lower() for tags in self.raw_tags]
-
-    def lemmatize(self):
-        """ Lemmatize tokens"""
-        self.lemma_caption = [map(lambda x: self.wordnet_lemmatizer.lemmatize(x), caption) for caption in self.tokens_captions]
-        self.lemma_comments = [map(lambda x: self.wordnet_lemmatizer.lemmatize(x), comments) for comments in self.tokens_comments]
-        self.lemma_tags = [map(lambda x: self.wordnet_lemmatizer.lemmatize(x), tags) for tags in self.tokens_tags]
-        self.lemma_all = [map(lambda x: self.wordnet_lemmatizer.lemmatize(x), tokens) for tokens in self.tokens_all]
+        self.lemma_comments = []
+        self.lemma_caption = []
+        self.lemma_tags = []
+        self.lemma_all = []
+        self.emojis = []
+        self.hashtags = []
+        for post in self.stream(ids, comments, captions, tags, processes):
+            self.raw_id.append(post["id"])
+            self.raw_comments.append(post["comments"])
+            self.raw_captions.append(post["caption"])
+            self.raw_tags.append(post["tags"])
+            self.tokens_comments.append(post["tokens_comments"])
+            self.tokens_captions.append(post["tokens_caption"])
+            self.tokens_tags.append(post["tokens_tags"])
+            self.tokens_all.append(post["tokens_all"])
+            self.lemma_comments.append(post["lemma_comments"])
+            self.lemma_caption.append(post["lemma_caption"])
+            self.lemma_tags.append(post["lemma_tags"])
+            self.lemma_all.append(post["lemma_all"])
+            self.emojis.append(post["emojis"])
+            self.hashtags.append(post["hashtags"])
+        print("Normalized, tokenized and lemmatized the text, extracted emojis and hashtags")
+        if pos:
+            self.pos_tag(processes)
+
+    @classmethod
+    def stream(cls, ids, comments, captions, tags, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Normalized posts (dicts, see normalize_post) of the iterables of ids, comments, captions and tags,
+        one at a time and in order. With processes > 1 chunks of chunk_size posts are normalized in a pool of
+        processes
+        """
+        posts = izip(ids, comments, captions, tags)
+        if processes <= 1:
+            for post in posts:
+                yield cls.normalize_post(*post)
+        else:
+            for post in chunked_map(normalize_chunk, posts, processes, chunk_size):
+                yield post
+
+    @classmethod
+    def normalize_post(cls, id, comments, caption, tags):
+        """
+        Normalized post: the lowercased unicode text of the fields, their tokens without stopwords and the lemmas
+        of the tokens, per field and for all fields (caption, comments, tags), and the emojis and hashtags
+        """
+        comments = cls.normalize_text(comments)
+        caption = cls.normalize_text(caption)
+        tags = cls.normalize_text(tags)
+        tokens_comments = cls.tokenize(comments)
+        tokens_caption = cls.tokenize(caption)
+        tokens_tags = cls.tokenize(tags)
+        tokens_all = tokens_caption + tokens_comments + tokens_tags
+        lemma_comments = map(cls.lemma, tokens_comments)
+        lemma_caption = map(cls.lemma, tokens_caption)
+        lemma_tags = map(cls.lemma, tokens_tags)
+        return {
+            "id": id,
+            "comments": comments,
+            "caption": caption,
+            "tags": tags,
+            "tokens_comments": tokens_comments,
+            "tokens_caption": tokens_caption,
+            "tokens_tags": tokens_tags,
+            "tokens_all": tokens_all,
+            "lemma_comments": lemma_comments,
+            "lemma_caption": lemma_caption,
+            "lemma_tags": lemma_tags,
+            "lemma_all": lemma_caption + lemma_comments + lemma_tags,
+            "emojis": [c for c in tokens_all if c in emoji.UNICODE_EMOJI],
+            "hashtags": [x for x in tokens_all if x.startswith("#")]
+        }
+
+    @staticmethod
+    def normalize_text(text):
+        """ Remove non-unicode characters, lowercase and convert to unicode"""
+        return text.decode('utf-8', 'ignore').encode("utf-8").lower().decode('utf-8')
+
+    @classmethod
+    def tokenize(cls, text):
+        """ Tokenize text with TweetTokenizer, preserve emojis, hashtags etc, remove stopwords"""
+        return [token for token in cls.tknzr.tokenize(text) if token not in cls.stop_words]
+
+    @classmethod
+    def lemma(cls, token):
+        """ Lemma of a token, cached"""
+        return cls.lemma_cache.get(token, cls.wordnet_lemmatizer.lemmatize, token)
 
     def remove_urls(self):
         """ Remove urls from tokens """
@@ -97,21 +143,45 @@ class PreProcessor(object):
         self.tokens_tags = [filter(lambda x: "http" not in x, tags) for tags in self.tokens_tags]
         self.tokens_all = [filter(lambda x: "http" not in x, tokens) for tokens in self.tokens_all]
 
-    def remove_stopwords(self):
-        """ Remove stopwords from tokens """
-        self.tokens_captions = [[token for token in caption if token not in self.stop_words] for caption in self.tokens_captions]
-        self.tokens_comments = [[token for token in comments if token not in self.stop_words] for comments in self.tokens_comments]
-        self.tokens_tags = [[token for token in tags if token not in self.stop_words] for tags in self.tokens_tags]
-        self.tokens_all = [[token for token in tokens if token not in self.stop_words] for tokens in self.tokens_all]
+    def pos_tag(self, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """ Extract POS tags, in chunks in a pool of processes if processes > 1, prints the throughput """
+        start = time.time()
+        if processes <= 1:
+            self.pos_tokens = [self.tagger.tag(tokens) for tokens in self.tokens_all]
+        else:
+            self.pos_tokens = list(chunked_map(pos_tag_chunk, self.tokens_all, processes, chunk_size))
+        elapsed = max(time.time() - start, 1e-6)
+        print("Extracted POS of {0} posts in {1:.1f}s ({2:.0f} posts/s)".format(
+            len(self.pos_tokens), elapsed, len(self.pos_tokens) / elapsed))
 
-    def extract_emojis(self):
-        """ Extract emojis """
-        self.emojis = [[c for c in tokens if c in emoji.UNICODE_EMOJI] for tokens in self.tokens_all]
 
-    def extract_hashtags(self):
-        """ Extract hashtags """
-        self.hashtags = [[x for x in tokens if x.startswith("#")] for tokens in self.tokens_all]
-
-    def pos_tag(self):
-        """ Extract POS tags """
-        self.pos_tokens = [self.tagger.tag(tokens) for tokens in self.tokens_all]
+def chunked_map(fn, items, processes, chunk_size):
+    """
+    Results of fn over chunks of chunk_size items in a pool of processes (fn maps a list of items to a list of
+    results), one at a time and in order. At most two chunks per process are read ahead, unlike Pool.imap which
+    reads all the items
+    """
+    items = iter(items)
+    pool = Pool(processes)
+    try:
+        pending = deque()
+        for chunk in iter(lambda: list(islice(items, chunk_size)), []):
+            pending.append(pool.apply_async(fn, (chunk,)))
+            if len(pending) >= 2 * processes:
+                for result in pending.popleft().get():
+                    yield result
+        while len(pending) > 0:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+
+
+def normalize_chunk(posts):
+    """ Normalized posts of a chunk of (id, comments, caption, tags), in a worker process"""
+    return [PreProcessor.normalize_post(*post) for post in posts]
+
+
+def pos_tag_chunk(tokens):
+    """ POS tags of a chunk of token lists, in a worker process with the tagger loaded at import (inherited on fork)"""
+    return [PreProcessor.tagger.tag(post_tokens) for post_tokens in tokens]
@@ -0,0 +1,77 @@
+import json
+import os
+import uuid
+
+"""
+Checkpointed output of the information extraction, for runs that can be interrupted and resumed.
+
+Every partition writes its results as they are computed, a JSON object per post per line, to files
+part-<run>-<partition>-<chunk>.jsonl in the output directory. A chunk is written to a hidden temporary file and
+renamed when complete, so the output directory only has complete files and an interrupted run loses at most
+one chunk per partition. A resumed run reads the ids of the posts in the output directory and skips them.
+"""
+
+DEFAULT_EVERY = 100
+
+
+def new_run():
+    """ Unique name of a run, keeps the files of the runs writing to the same directory apart"""
+    return uuid.uuid4().hex[:12]
+
+
+def output_files(directory):
+    """ Complete checkpoint files in the output directory"""
+    if not os.path.exists(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith("part-") and name.endswith(".jsonl"))
+
+
+def done_ids(directory):
+    """ Ids of the posts in the checkpoint files of the output directory"""
+    ids = set()
+    for path in output_files(directory):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip() != "":
+                    ids.add(json.loads(line)["id"])
+    return ids
+
+
+def write_chunk(directory, run, partition, chunk, lines):
+    """ Write the lines of a chunk atomically, to a temporary file renamed when complete"""
+    name = "part-{0}-{1:05d}-{2:05d}.jsonl".format(run, partition, chunk)
+    tmp_path = os.path.join(directory, "." + name + ".tmp")
+    with open(tmp_path, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, os.path.join(directory, name))
+
+
+def write_partition(rows, directory, run, partition, every=DEFAULT_EVERY):
+    """
+    Write the result rows (pyspark Rows) of a partition as they come, in checkpoint files of every rows,
+    yields the number of rows written
+    """
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created concurrently by another partition
+            pass
+    lines = []
+    chunk = 0
+    count = 0
+    for row in rows:
+        lines.append(json.dumps(row.asDict(recursive=True)))
+        if len(lines) >= every:
+            write_chunk(directory, run, partition, chunk, lines)
+            count += len(lines)
+            chunk += 1
+            lines = []
+    if len(lines) > 0:
+        write_chunk(directory, run, partition, chunk, lines)
+        count += len(lines)
+    yield count
@@ -13,7 +13,7 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
 
 """
 
-import requests
+import http_session
 
 DD_TIMEOUT = 2000  # seconds, for long blocking training calls, as needed
 
@@ -39,12 +39,17 @@ class DD(object):
     __HTTP = 0
     __HTTPS = 1
 
-    def __init__(self, host="localhost", port=8080, proto=0, apiversion="0.1"):
+    def __init__(self, host="localhost", port=8080, proto=0, apiversion="0.1",
+                 pool_size=http_session.DEFAULT_POOL_SIZE, retries=http_session.DEFAULT_RETRIES,
+                 backoff=http_session.DEFAULT_BACKOFF):
         """ DD class constructor
         Parameters:
         host -- the DeepDetect server host
         port -- the DeepDetect server port
         proto -- user http (0,default) or https connection
+        pool_size -- number of kept-alive connections to the server
+        retries -- number of retries of failed requests
+        backoff -- backoff factor (seconds) between retries
         """
         self.apiversion = apiversion
         self.__urls = API_METHODS_URL[apiversion]
@@ -52,6 +57,7 @@ class DD(object):
         self.__port = port
         self.__proto = proto
         self.__returntype = self.RETURN_PYTHON
+        self.__session = http_session.session(pool_size, retries, backoff)
         if proto == self.__HTTP:
             self.__ddurl = 'http://%s:%d' % (host, port)
         else:
@@ -72,28 +78,28 @@ class DD(object):
     def get(self, method, json=None, params=None):
         """GET to DeepDetect server """
         url = self.__ddurl + method
-        r = requests.get(url=url, json=json, params=params, timeout=DD_TIMEOUT)
+        r = self.__session.get(url=url, json=json, params=params, timeout=DD_TIMEOUT)
         r.raise_for_status()
         return self.__return_data(r)
 
     def put(self, method, json=None, params=None):
         """PUT request to DeepDetect server"""
         url = self.__ddurl + method
-        r = requests.put(url=url, json=json, params=params, timeout=DD_TIMEOUT)
+        r = self.__session.put(url=url, json=json, params=params, timeout=DD_TIMEOUT)
         r.raise_for_status()
         return self.__return_data(r)
 
     def post(self, method, json=None, params=None):
         """POST request to DeepDetect server"""
         url = self.__ddurl + method
-        r = requests.post(url=url, json=json, params=params, timeout=DD_TIMEOUT)
+        r = self.__session.post(url=url, json=json, params=params, timeout=DD_TIMEOUT)
         r.raise_for_status()
         return self.__return_data(r)
 
     def delete(self, method, json=None, params=None):
         """DELETE request to DeepDetect server"""
         url = self.__ddurl + method
-        r = requests.delete(url=url, json=json, params=params, timeout=DD_TIMEOUT)
+        r = self.__session.delete(url=url, json=json, params=params, timeout=DD_TIMEOUT)
         r.raise_for_status()
         return self.__return_data(r)
 
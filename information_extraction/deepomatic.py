@@ -22,8 +22,9 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import requests
 import json
+import time
+import http_session
 from six import string_types
 from requests.structures import CaseInsensitiveDict
 
@@ -67,10 +68,12 @@ class TaskError(Exception):
 
 class HTTPHelper(object):
 
-    def __init__(self, app_id, api_key, verify, host):
+    def __init__(self, app_id, api_key, verify, host, pool_size=http_session.DEFAULT_POOL_SIZE,
+                 retries=http_session.DEFAULT_RETRIES, backoff=http_session.DEFAULT_BACKOFF):
         """
-        Init the HTTP helper with API key and secret
+        Init the HTTP helper with API key and secret, requests go through a pooled session
         """
+        self.session = http_session.session(pool_size, retries, backoff)
         self.api_key = str(api_key)
         self.app_id = str(app_id)
 
@@ -138,38 +141,40 @@ class HTTPHelper(object):
         """
         Perform a GET request
         """
-        return self.make_request(requests.get, resource, params)
+        return self.make_request(self.session.get, resource, params)
 
     def delete(self, resource, params=None):
         """
         Perform a DELETE request
         """
-        return self.make_request(requests.delete, resource, params)
+        return self.make_request(self.session.delete, resource, params)
 
     def put(self, resource, params=None, data=None, content_type='application/json', files=None):
         """
         Perform a PUT request
         """
-        return self.make_request(requests.put, resource, params, data, content_type, files)
+        return self.make_request(self.session.put, resource, params, data, content_type, files)
 
     def post(self, resource, params=None, data=None, content_type='application/json', files=None):
         """
         Perform a POST request
         """
-        return self.make_request(requests.post, resource, params, data, content_type, files)
+        return self.make_request(self.session.post, resource, params, data, content_type, files)
 
     def patch(self, resource, params=None, data=None, content_type='application/json', files=None):
         """
         Perform a PATCH request
         """
-        return self.make_request(requests.patch, resource, params, data, content_type, files)
+        return self.make_request(self.session.patch, resource, params, data, content_type, files)
 
 
 ###############################################################################
 
 class Client(object):
 
-    def __init__(self, app_id, api_key, verify=True, host=API_HOST, version=API_VERSION):
+    def __init__(self, app_id, api_key, verify=True, host=API_HOST, version=API_VERSION,
+                 pool_size=http_session.DEFAULT_POOL_SIZE, retries=http_session.DEFAULT_RETRIES,
+                 backoff=http_session.DEFAULT_BACKOFF):
         if app_id is None or api_key is None:
             raise Exception("Please specify APP_ID and API_KEY.")
 
@@ -185,11 +190,18 @@ class Client(object):
 
             host += '/' + version
 
-        self.helper = HTTPHelper(app_id, api_key, verify, host)
+        self.helper = HTTPHelper(app_id, api_key, verify, host, pool_size, retries, backoff)
 
     # task endpoints
 
-    def waitForCompletion(self, response):
+    def waitForCompletion(self, response, interval=0.1, max_interval=2.0, timeout=None):
+        """
+        Poll a task until it is done, waiting interval seconds between polls and twice as long after every poll
+        (at most max_interval). TaskError if it failed or is still pending after timeout seconds
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
         while True:
             t = self.retrieveTask(response["task_id"])['task']
             status = t['status']
@@ -197,6 +209,10 @@ class Client(object):
                 if status == "error":
                     raise TaskError(t)
                 return t
+            if deadline is not None and time.time() + interval > deadline:
+                raise TaskError(t)
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
 
     def _waitTaskOrNot(self, response, wait=False):
         if wait:
@@ -208,6 +224,15 @@ class Client(object):
     def retrieveTask(self, task_id):
         return self.helper.get('/tasks/%s/' % task_id)
 
+    def retrieveTasks(self, task_ids):
+        """
+        State of many tasks with one request
+        """
+        response = self.helper.get('/tasks/', params={'task_ids': list(task_ids)})
+        if not isinstance(response, dict):
+            return []
+        return response.get('tasks', response.get('results', []))
+
     # networks endpoints
 
     def list_networks(self):
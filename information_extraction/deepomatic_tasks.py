@@ -0,0 +1,129 @@
+import time
+
+from deepomatic import BadStatus
+
+"""
+Deepomatic fashion detection of many images with asynchronous tasks.
+
+A detection is a task of the Deepomatic API that is submitted and then polled until it is done. The task manager
+keeps up to max_in_flight tasks of a batch of images in flight: it submits them up front, polls all pending tasks
+with one bulk request, waits between polls with exponential backoff and yields the result of every task as soon as
+it is done. Tasks that are not done before the deadline of the batch are given up. If a bulk response has none of
+the pending tasks (the API does not accept bulk requests or answers in another shape), every task is polled with
+its own request from then on.
+"""
+
+DEFAULT_POLL_INTERVAL = 0.1
+DEFAULT_MAX_POLL_INTERVAL = 2.0
+DEFAULT_DEADLINE = 60
+DEFAULT_MAX_IN_FLIGHT = 32
+
+
+def detection_candidates(task):
+    """ (item, summed probability of its boxes) of every item detected by a successful task"""
+    candidates = []
+    for item, boxes in task[u"data"][u"boxes"].items():
+        probability = 0.0
+        for box in boxes:
+            probability = probability + box[u"proba"]
+        candidates.append((item.encode("utf-8"), probability))
+    return candidates
+
+
+class TaskManager(object):
+    """ Submits and polls detection tasks of a Deepomatic client"""
+
+    def __init__(self, client, poll_interval=DEFAULT_POLL_INTERVAL, max_poll_interval=DEFAULT_MAX_POLL_INTERVAL,
+                 deadline=DEFAULT_DEADLINE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.deadline = deadline
+        self.max_in_flight = max_in_flight
+        self.bulk = True
+
+    def submit(self, link):
+        """ Id of a new fashion detection task of an image url"""
+        return self.client.helper.get("/detect/fashion/", params={"url": link})[u"task_id"]
+
+    def poll(self, task_ids):
+        """ Current state of the tasks, by task id. Tasks missing from a response are still pending"""
+        if self.bulk:
+            try:
+                tasks = dict((str(task[u"id"]), task) for task in self.client.retrieveTasks(task_ids)
+                             if isinstance(task, dict) and u"id" in task)
+            except BadStatus as e:
+                if e.status_code not in (400, 404, 405):
+                    raise
+                tasks = {}
+            except (AttributeError, TypeError):
+                # Not a list of tasks
+                tasks = {}
+            if any(task_id in tasks for task_id in task_ids):
+                return tasks
+            # The bulk response has none of the tasks, its shape is not the expected one
+            print("deepomatic bulk task polling not supported, polling every task")
+            self.bulk = False
+        return dict((task_id, self.client.retrieveTask(task_id)[u"task"]) for task_id in task_ids)
+
+    def detect(self, links):
+        """
+        Yields (index of the link, task) for every image url as soon as its task is done, task is None if it
+        failed or was not done before the deadline
+        """
+        deadline = time.time() + self.deadline
+        queued = list(enumerate(links))
+        queued.reverse()
+        pending = {}
+        interval = self.poll_interval
+        while len(queued) > 0 or len(pending) > 0:
+            submitted = False
+            while len(queued) > 0 and len(pending) < self.max_in_flight and time.time() < deadline:
+                i, link = queued.pop()
+                try:
+                    pending[str(self.submit(link))] = i
+                    submitted = True
+                except (IOError, ValueError, KeyError, BadStatus) as e:
+                    print("error in deepomatic task submission: {0}".format(e))
+                    yield i, None
+            if submitted:
+                interval = self.poll_interval
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            if len(pending) == 0:
+                continue
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.max_poll_interval)
+            try:
+                tasks = self.poll(list(pending.keys()))
+            except (IOError, ValueError, KeyError, BadStatus) as e:
+                print("error in deepomatic task polling: {0}".format(e))
+                continue
+            for task_id, task in tasks.items():
+                if task_id not in pending or task[u"status"] == u"pending":
+                    continue
+                i = pending.pop(task_id)
+                if task[u"status"] == u"success":
+                    yield i, task
+                else:
+                    print("error in deepomatic task: {0}".format(task))
+                    yield i, None
+        if len(pending) > 0 or len(queued) > 0:
+            print("{0} deepomatic task(s) not done before the deadline".format(len(pending) + len(queued)))
+        for i in pending.values():
+            yield i, None
+        for i, link in queued:
+            yield i, None
+
+    def detect_all(self, links):
+        """ Candidates of every image url, empty for the images whose task failed or did not finish in time"""
+        candidates = [[] for link in links]
+        for i, task in self.detect(links):
+            if task is None:
+                continue
+            try:
+                candidates[i] = detection_candidates(task)
+            except (KeyError, TypeError, AttributeError):
+                print("error in deepomatic task data: {0}".format(task))
+        return candidates
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+"""
+Local stand-in for the external services used by the information extraction, to run and test offline.
+
+- Probase: GET /api/Concept/ScoreByProb?instance=...&topK=... answers with the concepts of the instance in a
+  JSON fixture file ({instance: {concept: probability}}), {} for unknown instances
+- DeepDetect: PUT /services/<name> accepts any service, POST /predict answers with deterministic classes for every image uri of the request (the same for
+  a given service and uri), in shuffled order to check that clients match predictions on their uri
+- Google Vision: POST /v1/images:annotate answers every image of a batch request with deterministic labels
+  (REST format of batch_annotate_images)
+- Clarifai: POST /v2/models/<model>/outputs answers every input image url with deterministic concepts, in order
+  (REST format of multi-input predict)
+- Deepomatic: GET /v0.6/detect/fashion/?url=... starts a detection task, which is pending for about task_time
+  seconds and then has deterministic boxes for the url. GET /v0.6/tasks/<id>/ answers with a task,
+  GET /v0.6/tasks/?task_ids=...&task_ids=... with many tasks
+- Static pages: GET /pages/<name> serves the file <name> of a fixture directory as HTML (e.g. liketk.it and
+  product pages for the liketkit scraper), 404 for missing files
+
+Point the configuration at it, e.g. "probase_service_url": "http://localhost:8899/api/Concept/ScoreByProb",
+or the DeepDetect client at localhost:8899 and the Deepomatic client at http://localhost:8899.
+The server counts the requests it gets per path, which is served on GET /stats. Every request to a fake image
+service takes latency seconds, like a round trip to the real service.
+"""
+
+
+class FakeServices(ThreadingMixIn, HTTPServer):
+    """ HTTP server with the fixtures and request counts of the fake services"""
+    daemon_threads = True
+
+    def __init__(self, address, probase_concepts, pages_dir="", latency=0.0, task_time=0.0):
+        HTTPServer.__init__(self, address, FakeServicesHandler)
+        self.probase_concepts = probase_concepts
+        self.pages_dir = pages_dir
+        self.latency = latency
+        self.task_time = task_time
+        self.requests = {}
+        # Deepomatic tasks, id -> (url, time when it is done)
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start_task(self, url):
+        """ Id of a new Deepomatic task of an image url, done after task_time seconds (+-50%, by url)"""
+        rng = random.Random(int(hashlib.md5(url.encode("utf-8")).hexdigest()[:8], 16))
+        with self.lock:
+            task_id = len(self.tasks) + 1
+            self.tasks[task_id] = (url, time.time() + self.task_time * (0.5 + rng.random()))
+        return task_id
+
+    def task(self, task_id):
+        """ Deepomatic task, None for unknown ids"""
+        with self.lock:
+            if task_id not in self.tasks:
+                return None
+            url, done = self.tasks[task_id]
+        return deepomatic_task(task_id, url, time.time() >= done)
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    """ Routes requests to the fake services"""
+    # Keep connections alive like the real services
+    protocol_version = "HTTP/1.1"
+    # Buffered writes, sent at once after every request
+    wbufsize = -1
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+        if url.path == "/stats":
+            self.reply(200, self.server.requests)
+            return
+        self.server.count(url.path)
+        if url.path == "/api/Concept/ScoreByProb":
+            instance = params.get("instance", [""])[0]
+            top_k = int(params.get("topK", ["10"])[0])
+            concepts = self.server.probase_concepts.get(instance, {})
+            top = sorted(concepts.items(), reverse=True, key=lambda x: x[1])[:top_k]
+            self.reply(200, dict(top))
+        elif url.path.startswith("/pages/"):
+            self.page(os.path.basename(url.path))
+        elif url.path.startswith("/v0.6/"):
+            time.sleep(self.server.latency)
+            self.deepomatic(url.path[len("/v0.6"):], params)
+        else:
+            self.reply(404, {"error": "unknown path " + url.path})
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        self.server.count(url.path)
+        request = json.loads(self.rfile.read(int(self.headers.getheader("Content-Length", 0))))
+        if url.path == "/predict":
+            self.reply(200, deep_detect_predict(request))
+        elif url.path == "/v1/images:annotate":
+            time.sleep(self.server.latency)
+            self.reply(200, vision_annotate(request))
+        elif url.path.startswith("/v2/models/") and url.path.endswith("/outputs"):
+            time.sleep(self.server.latency)
+            self.reply(200, clarifai_outputs(request))
+        else:
+            self.reply(404, {"error": "unknown path " + url.path})
+
+    def do_PUT(self):
+        url = urlparse.urlparse(self.path)
+        self.server.count(url.path)
+        self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        if url.path.startswith("/services/"):
+            self.reply(201, {"status": {"code": 201, "msg": "Created"}})
+        else:
+            self.reply(404, {"error": "unknown path " + url.path})
+
+    def deepomatic(self, path, params):
+        """ Deepomatic detection and task endpoints"""
+        if path == "/detect/fashion/" and "url" in params:
+            self.reply(200, {"task_id": self.server.start_task(params["url"][0])})
+        elif path == "/tasks/":
+            tasks = [self.server.task(int(task_id)) for task_id in params.get("task_ids", [])]
+            self.reply(200, {"tasks": [task for task in tasks if task is not None]})
+        elif path.startswith("/tasks/") and self.server.task(int(path.split("/")[2])) is not None:
+            self.reply(200, {"task": self.server.task(int(path.split("/")[2]))})
+        else:
+            self.reply(404, {"error": "unknown path " + path})
+
+    def page(self, name):
+        """ Static page of the fixture directory"""
+        path = os.path.join(self.server.pages_dir, name)
+        if self.server.pages_dir == "" or not os.path.isfile(path):
+            self.reply(404, {"error": "unknown page " + name})
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def reply(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def deep_detect_predict(request):
+    """ DeepDetect /predict response with the best classes of every image of the request"""
+    sname = request["service"]
+    best = request.get("parameters", {}).get("output", {}).get("best", 1)
+    predictions = []
+    for uri in request["data"]:
+        seed = int(hashlib.md5((sname + "|" + uri).encode("utf-8")).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        probs = sorted([rng.random() for i in range(best)], reverse=True)
+        classes = [{"cat": "{0}_{1}".format(sname, rng.randint(0, 99)), "prob": prob} for prob in probs]
+        predictions.append({"uri": uri, "classes": classes})
+    random.shuffle(predictions)
+    return {"status": {"code": 200, "msg": "OK"},
+            "head": {"method": "/predict", "service": sname, "time": 0.0},
+            "body": {"predictions": predictions}}
+
+
+def vision_annotate(request):
+    """ Google Vision images:annotate response with labels for every image of the request"""
+    responses = []
+    for image_request in request["requests"]:
+        rng = random.Random(int(hashlib.md5(image_request["image"]["content"]).hexdigest()[:8], 16))
+        labels = [{"description": "label_{0}".format(rng.randint(0, 99)), "score": rng.random()} for i in range(5)]
+        responses.append({"labelAnnotations": labels})
+    return {"responses": responses}
+
+
+def clarifai_outputs(request):
+    """ Clarifai model outputs response with concepts for every input image url, in the order of the inputs"""
+    outputs = []
+    for image_input in request["inputs"]:
+        url = image_input["data"]["image"]["url"]
+        rng = random.Random(int(hashlib.md5(url.encode("utf-8")).hexdigest()[:8], 16))
+        concepts = [{"name": "concept {0}".format(rng.randint(0, 99)), "value": rng.random()} for i in range(5)]
+        outputs.append({"status": {"code": 10000, "description": "Ok"}, "input": {"data": {"image": {"url": url}}},
+                        "data": {"concepts": concepts}})
+    return {"status": {"code": 10000, "description": "Ok"}, "outputs": outputs}
+
+
+def deepomatic_task(task_id, url, done):
+    """ Deepomatic task of an image url, pending until done, then with deterministic boxes of fashion items"""
+    if not done:
+        return {"id": task_id, "status": "pending", "data": None}
+    rng = random.Random(int(hashlib.md5(url.encode("utf-8")).hexdigest()[:8], 16))
+    boxes = {}
+    for i in range(rng.randint(1, 3)):
+        boxes["item_{0}".format(rng.randint(0, 19))] = [{"proba": rng.random()} for j in range(rng.randint(1, 2))]
+    return {"id": task_id, "status": "success", "data": {"boxes": boxes}}
+
+
+def start(port, probase_concepts, pages_dir="", latency=0.0, task_time=0.0):
+    """ Start the fake services in a background thread, returns the server (stop it with shutdown())"""
+    server = FakeServices(("localhost", port), probase_concepts, pages_dir, latency, task_time)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def parse_args():
+    """Parses the commandline arguments with argparse"""
+    parser = argparse.ArgumentParser(description='Fake external services for offline runs and tests')
+    parser.add_argument("-p", "--port", help="port to listen on", type=int, default=8899)
+    parser.add_argument("-pc", "--probaseconcepts", help="JSON file with probase concepts per instance", default="")
+    parser.add_argument("-pg", "--pages", help="directory of static pages served on /pages/<name>", default="")
+    parser.add_argument("-l", "--latency", help="seconds per request to the fake image services", type=float,
+                        default=0.0)
+    parser.add_argument("-t", "--tasktime", help="seconds until a fake Deepomatic task is done", type=float,
+                        default=0.0)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    """ Serve the fake services until interrupted"""
+    args = parse_args()
+    probase_concepts = {}
+    if args.probaseconcepts != "":
+        probase_concepts = json.load(open(args.probaseconcepts))
+    server = FakeServices(("localhost", args.port), probase_concepts, args.pages, args.latency, args.tasktime)
+    print("serving fake services on port {0}".format(args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
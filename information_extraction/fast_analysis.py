@@ -2,22 +2,24 @@
 # coding=utf-8
 # Author: Kim Hammar <kimham@kth.se> KTH 2018
 
-from InformationExtraction import InformationExtractor
+from InformationExtraction import ExtractorConfig
+from lookup_pool import LookupTimeout
+import checkpoints
+import itertools
 import os
 import re
 import emoji
 import pyspark
 import pyspark.sql
 from pyspark.sql.types import StructType, StructField
-from pyspark.sql.types import DoubleType, IntegerType, StringType
+from pyspark.sql.types import ArrayType, DoubleType, IntegerType, MapType, StringType
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import TweetTokenizer
 from collections import Counter
-from wordsegment import load, segment
+import hashtag_segmenter
 import argparse
-from gensim.models import TfidfModel
-from gensim.corpora import Dictionary
+from tfidf_index import TfidfIndex, TfidfStore
 
 """
 Script for analyzing users, uses Preprocessor.py and InformationExtraction.py
@@ -35,7 +37,18 @@ tknzr_strip_users = TweetTokenizer(strip_handles=True, reduce_len=True)
 wordnet_lemmatizer = WordNetLemmatizer()
 stop_words = set(stopwords.words('english'))
 stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
-load()
+liketkit_re = re.compile(r"http://liketk.it/([^\s]+)")
+emoji_table = frozenset(emoji.UNICODE_EMOJI)
+
+# Schema of the results, the classes of every labeling function are scores per attribute family
+classes_type = MapType(StringType(), MapType(StringType(), DoubleType()))
+classification_fields = ["text_clustering", "liketkit_classification", "google_vision_classification",
+                         "deep_detect_classification", "clarifai_classification", "deepomatic_classification"]
+result_schema = StructType([StructField("id", StringType(), True),
+                            StructField("url", StringType(), True),
+                            StructField("hashtags", ArrayType(StringType()), True),
+                            StructField("links", ArrayType(StringType()), True)] +
+                           [StructField(field, classes_type, True) for field in classification_fields])
 
 
 def clean_text(text, tokenizer):
@@ -50,18 +63,16 @@ def clean_text(text, tokenizer):
     return list_of_words
 
 
-def create_tf_idf(corporaPath):
-    """
-    Compute the TF-IDF scores based on the entire corpus
-    """
-    docs = []
-    ids = []
+def corpus_documents(corporaPath, skip=frozenset()):
+    """ Stream the (id, cleaned tokens) of the posts of the corpus, posts with an id in skip are not cleaned"""
     with open(corporaPath, "r") as csvfile:
         for line in csvfile:
             line = line.replace("\n", " ")
             parts = line.split(",")
             if (len(parts) == 5):
                 id = parts[0]
+                if id in skip:
+                    continue
                 url = parts[1]
                 comments = parts[2]
                 if comments is not None:
@@ -78,23 +89,35 @@ def create_tf_idf(corporaPath):
                     tags = clean_text(tags, tknzr_strip_users)
                 else:
                     tags = []
-            docs.append(comments + caption + tags)
-            ids.append(id)
-    idx_to_id = {}
-    for i, id in enumerate(ids):
-        idx_to_id[i] = id
-
-    dct = Dictionary(docs)
-    corpus = [dct.doc2bow(line) for line in docs]
-    model = TfidfModel(corpus)
-    tfidf_factors = {}
-    for i, doc in enumerate(corpus):
-        temp = {}
-        for word_id, value in model[doc]:
-            word = dct.get(word_id)
-            temp[word] = value
-        tfidf_factors[idx_to_id[i]] = temp
-    return tfidf_factors
+                yield id, comments + caption + tags
+
+
+def corpus_hashtags(corporaPath):
+    """ Stream the hashtags (without #) of the posts of the corpus that are segmented"""
+    with open(corporaPath, "r") as csvfile:
+        for line in csvfile:
+            parts = line.replace("\n", " ").split(",")
+            if (len(parts) == 5):
+                text = (parts[2] + parts[3] + parts[4]).decode("utf-8", "ignore")
+                for token in tknzr.tokenize(text):
+                    if token.startswith("#") and len(token) < 20:
+                        yield token.strip("#")
+
+
+def create_tf_idf(corporaPath, storePath="", check=False):
+    """
+    Compute the TF-IDF scores based on the entire corpus, streamed twice from the file.
+    With a store, only the posts that are not in the store yet are added to it
+    """
+    if storePath == "":
+        return TfidfIndex.build(lambda: corpus_documents(corporaPath))
+    store = TfidfStore(storePath)
+    added = store.update(corpus_documents(corporaPath, store.ids()))
+    print("added {0} posts to the TF-IDF store".format(added))
+    if check:
+        mismatches = store.check(lambda: corpus_documents(corporaPath))
+        print("TF-IDF store check, posts that differ from a full rebuild: {0}".format(len(mismatches)))
+    return store.index()
 
 
 def filterOccurenceCount(iter):
@@ -137,7 +160,7 @@ def parse_args():
     parser.add_argument("-lk", "--liketkit", help="flag whether to scrape liketkit links in the classification",
                         action="store_true")
     parser.add_argument("-pa", "--partitions", help="number of spark partitions",
-                        default=1)
+                        type=int, default=1)
     parser.add_argument("-ma", "--materials", help="path to file with clothing materials/fabrics",
                         default="./domain_data/material.csv")
     parser.add_argument("-it", "--items", help="path to file with sub-categories of clothing items",
@@ -157,8 +180,32 @@ def parse_args():
                         default="./domain_data/probase_materials.csv")
     parser.add_argument("-vec", "--vectors", help="path to file with word vectors",
                         default="./vectors/vectors.vec")
+    parser.add_argument("-f", "--format", help="format of the output, parquet or json",
+                        choices=["parquet", "json"], default="parquet")
+    parser.add_argument("-re", "--resume",
+                        help="flag whether to checkpoint the results per post and skip the posts already in the output"
+                             " (requires --format json)",
+                        action="store_true")
+    parser.add_argument("-ce", "--checkpointevery", help="number of posts per checkpoint file",
+                        type=int, default=checkpoints.DEFAULT_EVERY)
+    parser.add_argument("-sc", "--segmentcache", help="path to the persistent cache of hashtag segmentations",
+                        default="")
+    parser.add_argument("-sg", "--segmenter", help="hashtag segmentation backend, wordsegment or fast",
+                        choices=hashtag_segmenter.BACKENDS, default="wordsegment")
+    parser.add_argument("-ps", "--presegment",
+                        help="flag whether to segment the distinct hashtags of the input into the --segmentcache first",
+                        action="store_true")
+    parser.add_argument("-tf", "--tfidfstore", help="path to the TF-IDF store to add the new posts to", default="")
+    parser.add_argument("-tfc", "--tfidfcheck", help="flag whether to check the TF-IDF store against a full rebuild",
+                        action="store_true")
 
     args = parser.parse_args()
+    if args.resume and args.format != "json":
+        # The checkpoint files are JSON lines, they cannot be written as Parquet
+        parser.error("--resume writes JSON lines checkpoints, it requires --format json")
+    if args.presegment and args.segmentcache == "":
+        # Without a persistent cache the segmentations would stay in the memory of the driver
+        parser.error("--presegment requires --segmentcache")
     return args
 
 
@@ -182,28 +229,60 @@ def parse_raw(sql, filePath):
     return df
 
 
-def map_post(row, information_extractor, index, args):
-    """Process post, semantic + syntactic similarity classification"""
+def map_partition(partition, rows, extractor_config, args):
+    """
+    Pre-process and process the raw posts of a partition as a stream, with the information extractor
+    (and its HTTP sessions and caches) of the executor. The images of image_batch_size posts at a time
+    are classified with multi-image requests to DeepDetect, Google Vision and Clarifai, and with Deepomatic
+    detection tasks that are in flight together
+    """
+    information_extractor = extractor_config.extractor()
+    posts = enumerate(premap_post(row, args) for row in rows)
+    while True:
+        batch = list(itertools.islice(posts, information_extractor.image_batch_size))
+        if len(batch) == 0:
+            break
+        batch_classes = image_batch_LFs([row for index, row in batch], information_extractor, args)
+        for i, (index, row) in enumerate(batch):
+            yield map_post(row, information_extractor, partition, index, args,
+                           dict((service, classes[i]) for service, classes in batch_classes.items()))
+    hashtag_segmenter.get(args.segmentcache, args.segmenter).flush()
+
+
+def map_post(row, information_extractor, partition, index, args, batch_classes=None):
+    """
+    Process post, semantic + syntactic similarity classification. index is the position of the post in its partition,
+    batch_classes are the classes of the post image per service ("deepdetect", "google_vision", "clarifai",
+    "deepomatic") for the services that were already looked up in a batch
+    """
+    if batch_classes is None:
+        batch_classes = {}
     if index % 10 == 0:
-        print ("Processing post with index {0}".format(index))
+        print ("Processing post with index {0} of partition {1}".format(index, partition))
     text_clustering_res = {}
     liketkit_classes = {}
-    google_vision_classes = {}
-    deep_detect_classes = {}
-    clarifai_classes = {}
-    deepomatic_classes = {}
+    # The image services are queried concurrently while the text is analyzed
+    lookups = {}
+    if (args.google and "google_vision" not in batch_classes):
+        lookups["google_vision"] = information_extractor.lookups.submit("google_vision", google_vision_LF, row,
+                                                                        information_extractor)
+    if (args.deepdetect and "deepdetect" not in batch_classes):
+        lookups["deepdetect"] = information_extractor.lookups.submit("deepdetect", deep_detect_lookup, row,
+                                                                     information_extractor)
+    if (args.clarifai and "clarifai" not in batch_classes):
+        lookups["clarifai"] = information_extractor.lookups.submit("clarifai", clarifai_lookup, row,
+                                                                   information_extractor)
+    if (args.deepomatic and "deepomatic" not in batch_classes):
+        lookups["deepomatic"] = information_extractor.lookups.submit("deepomatic", deepomatic_lookup, row,
+                                                                     information_extractor)
     if (args.textanalysis):
         text_clustering_res = text_clustering_LF(row, information_extractor)
     if (args.liketkit):
         liketkit_classes = liktekit_LF(row, information_extractor)
-    if (args.google):
-        google_vision_classes = google_vision_LF(row, information_extractor)
-    if (args.deepdetect):
-        deep_detect_classes = deep_detect_lookup(row, information_extractor)
-    if (args.clarifai):
-        clarifai_classes = clarifai_lookup(row, information_extractor)
-    if (args.deepomatic):
-        deepomatic_classes = deepomatic_lookup(row, information_extractor)
+    google_vision_classes = batch_classes.get("google_vision", lookup_result(lookups, "google_vision"))
+    deep_detect_classes = batch_classes.get("deepdetect", lookup_result(lookups, "deepdetect"))
+    clarifai_classes = batch_classes.get("clarifai", lookup_result(lookups, "clarifai"))
+    deepomatic_classes = batch_classes.get("deepomatic", lookup_result(lookups, "deepomatic"))
     row = pyspark.sql.Row(id=row.id, hashtags=row.hashtags, links=row.links, text_clustering=text_clustering_res,
                           liketkit_classification=liketkit_classes,
                           google_vision_classification=google_vision_classes,
@@ -214,6 +293,43 @@ def map_post(row, information_extractor, index, args):
     return row
 
 
+def lookup_result(lookups, service):
+    """ Classes of a concurrent image lookup, empty if the service is not used or timed out"""
+    if service not in lookups:
+        return {}
+    try:
+        return lookups[service].result()
+    except LookupTimeout as e:
+        print(str(e))
+        return {}
+
+
+def image_batch_LFs(rows, information_extractor, args):
+    """
+    Classes of the images of a batch of posts, a list per service for the services that are used. The services are
+    queried concurrently, the posts of a service that times out get empty classes
+    """
+    batch_LFs = {}
+    if (args.deepdetect):
+        batch_LFs["deepdetect"] = deep_detect_batch_LF
+    if (args.google):
+        batch_LFs["google_vision"] = google_vision_batch_LF
+    if (args.clarifai):
+        batch_LFs["clarifai"] = clarifai_batch_LF
+    if (args.deepomatic):
+        batch_LFs["deepomatic"] = deepomatic_batch_LF
+    lookups = dict((service, information_extractor.lookups.submit(service + "_batch", LF, rows, information_extractor))
+                   for service, LF in batch_LFs.items())
+    batch_classes = {}
+    for service, lookup in lookups.items():
+        try:
+            batch_classes[service] = lookup.result()
+        except LookupTimeout as e:
+            print(str(e))
+            batch_classes[service] = [{} for row in rows]
+    return batch_classes
+
+
 def google_vision_LF(row, information_extractor):
     """ Analyze image with Google vision API """
     item_candidates = information_extractor.google_vision_lookup(row.image_path)
@@ -223,6 +339,17 @@ def google_vision_LF(row, information_extractor):
     return google_vision_classes
 
 
+def google_vision_batch_LF(rows, information_extractor):
+    """ Analyze the images of a batch of posts with Google vision API """
+    batch_classes = []
+    for item_candidates in information_extractor.google_vision_lookup_batch([row.image_path for row in rows]):
+        items = information_extractor.map_candidates_to_ontology(item_candidates)
+        google_vision_classes = {}
+        google_vision_classes["items"] = dict(items)
+        batch_classes.append(google_vision_classes)
+    return batch_classes
+
+
 def deep_detect_lookup(row, information_extractor):
     """ Analyze image with deepdetect """
     items_and_fabrics = information_extractor.deep_detect_lookup(row.url)
@@ -232,6 +359,18 @@ def deep_detect_lookup(row, information_extractor):
     return deep_detect_classes
 
 
+def deep_detect_batch_LF(rows, information_extractor):
+    """ Analyze the images of a batch of posts with deepdetect """
+    batch_items_and_fabrics = information_extractor.deep_detect_lookup_batch([row.url for row in rows])
+    batch_classes = []
+    for items_and_fabrics in batch_items_and_fabrics:
+        items = information_extractor.map_candidates_to_ontology(items_and_fabrics["items"])
+        deep_detect_classes = {}
+        deep_detect_classes["items"] = dict(items)
+        batch_classes.append(deep_detect_classes)
+    return batch_classes
+
+
 def deepomatic_lookup(row, information_extractor):
     """ Analyze image with deepomatic """
     candidates = information_extractor.deepomatic_lookup(row.url)
@@ -241,6 +380,17 @@ def deepomatic_lookup(row, information_extractor):
     return deepomatic_classes
 
 
+def deepomatic_batch_LF(rows, information_extractor):
+    """ Analyze the images of a batch of posts with deepomatic, their detection tasks are in flight together"""
+    batch_classes = []
+    for candidates in information_extractor.deepomatic_lookup_batch([row.url for row in rows]):
+        items = information_extractor.map_candidates_to_ontology(candidates)
+        deepomatic_classes = {}
+        deepomatic_classes["items"] = dict(items)
+        batch_classes.append(deepomatic_classes)
+    return batch_classes
+
+
 def clarifai_lookup(row, information_extractor):
     """ Analyze image with clarifai"""
     candidates = information_extractor.clarifai_lookup(row.url)
@@ -250,6 +400,17 @@ def clarifai_lookup(row, information_extractor):
     return clarifai_classes
 
 
+def clarifai_batch_LF(rows, information_extractor):
+    """ Analyze the images of a batch of posts with clarifai"""
+    batch_classes = []
+    for candidates in information_extractor.clarifai_lookup_batch([row.url for row in rows]):
+        items = information_extractor.map_candidates_to_ontology(candidates)
+        clarifai_classes = {}
+        clarifai_classes["items"] = dict(items)
+        batch_classes.append(clarifai_classes)
+    return batch_classes
+
+
 def emoji_LF(row, information_extractor):
     """ Analyze image based on emojis"""
 
@@ -270,190 +431,126 @@ def liktekit_LF(row, information_extractor):
 
 def text_clustering_LF(row, information_extractor):
     """ Analyze image based on semantic text clustering """
-    caption = row.caption
-    comments = row.comments
-    hashtags = row.hashtags
-    segmented_hashtags = row.segmented_hashtags
-    userhandles = row.userhandles
-    id = row.id
-    tags = row.tags
-
-    top_items = information_extractor.find_closest_semantic_hierarchy(caption, comments, tags,
-                                                                      hashtags + segmented_hashtags,
-                                                                      information_extractor.top_category_items, id, 10)
-    styles = information_extractor.find_closest_semantic_hierarchy(caption, comments, tags,
-                                                                   hashtags + segmented_hashtags,
-                                                                   information_extractor.styles, id, 10)
-    sub_items = sorted(
-        list(
-            set(
-                information_extractor.find_closest_semantic(caption, comments, tags, hashtags, segmented_hashtags, 10,
-                                                            information_extractor.items_lemmas.keys(), id))
-        ), reverse=True, key=lambda x: x[1]
-    )
-    materials = sorted(
-        list(set(information_extractor.find_closest_semantic(caption, comments, tags, hashtags, segmented_hashtags, 10,
-                                                             information_extractor.materials_lemmas.keys(), id))),
-        reverse=True, key=lambda x: x[1])
-    brands = sorted(
-        list(set(information_extractor.find_closest_semantic(caption + userhandles, comments, tags, hashtags,
-                                                             segmented_hashtags, 10,
-                                                             information_extractor.companies, id))),
-        reverse=True, key=lambda x: x[1])
-    patterns = sorted(
-        list(set(information_extractor.find_closest_semantic(caption, comments, tags, hashtags, segmented_hashtags, 10,
-                                                             information_extractor.patterns, id))),
-        reverse=True, key=lambda x: x[1])
-    ranked_materials = sorted(re_rank_materials(information_extractor, materials), reverse=True, key=lambda x: x[1])
-    ranked_brands = sorted(re_rank_brands(information_extractor, brands), reverse=True, key=lambda x: x[1])
-    text_clustering_LF = {}
-    text_clustering_LF["brands"] = dict(ranked_brands)
-    text_clustering_LF["patterns"] = dict(patterns)
-    text_clustering_LF["materials"] = dict(ranked_materials)
-    text_clustering_LF["item-category"] = dict(top_items)
-    text_clustering_LF["item-sub-category"] = dict(sub_items)
-    text_clustering_LF["styles"] = dict(styles)
-    return text_clustering_LF
-
-
-def re_rank_materials(information_extractor, materials):
-    """ Re-rank materials based on probase lookup"""
-    ranked_materials = map(lambda material: material_rank_mapper(information_extractor, material), materials)
-    return ranked_materials
-
-
-def material_rank_mapper(information_extractor, material_):
-    """ Re-rank materials based on probase lookup"""
-    material, rank = material_
-    factor_probase = lookup_material_probase(information_extractor, material, 10)
-    return (material, factor_probase * rank)
-
-
-def lookup_material_probase(information_extractor, query, num):
-    """Lookup material in Probase"""
-    material_params = {
-        'instance': query,
-        'topK': num
-    }
-    result = information_extractor.lookup_probase(material_params)
-    rank = information_extractor.rank_probase_result_material(result)
-    return rank
-
-
-def re_rank_brands(information_extractor, brands):
-    """ Re-rank brands based on probase lookup"""
-    ranked_brands = map(lambda brand: brand_rank_mapper(information_extractor, brand), brands)
-    return ranked_brands
-
-
-def brand_rank_mapper(information_extractor, brand_):
-    """ Re-rank brands based on probase lookup"""
-    brand, rank = brand_
-    factor_probase = lookup_company_probase(information_extractor, brand, 10)
-    return (brand, rank * factor_probase)
-
-
-def lookup_company_probase(information_extractor, query, num):
-    """ Lookup company in probase"""
-    company_params = {
-        'instance': query,
-        'topK': num
-    }
-    result = information_extractor.lookup_probase(company_params)
-    rank = information_extractor.rank_probase_result_company(result)
-    return rank
+    return information_extractor.classify_post(row.caption, row.comments, row.tags, row.hashtags,
+                                               row.segmented_hashtags, row.userhandles, row.id)
+
+
+def post_field(value):
+    """ Field of a raw post as unicode, "" if missing"""
+    if value is None:
+        return u""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "ignore")
+    return value
 
 
 def premap_post(row, args):
-    """Sloppy/Quick text normalization"""
-    if row._c0 is not None:
-        id = row._c0.encode('utf-8', 'ignore').decode("utf-8")
-    else:
-        id = ""
-    if row._c1 is not None:
-        url = row._c1.encode('utf-8', 'ignore').decode("utf-8")
-    else:
-        url = ""
-    if row._c2 is not None:
-        comments = row._c2.encode('utf-8', 'ignore').decode("utf-8")
-    else:
-        comments = ""
-    if row._c3 is not None:
-        caption = row._c3.encode('utf-8', 'ignore').decode("utf-8")
-    else:
-        caption = ""
-    if row._c4 is not None:
-        tags = row._c4.encode('utf-8', 'ignore').decode("utf-8")
-    else:
-        tags = ""
-    text = comments + caption + tags
-    tokens = tknzr.tokenize(text)
-    hashtags = [x for x in tokens if x.startswith("#")]
+    """
+    Sloppy/Quick text normalization. Every field is tokenized once with and once without username handles, and
+    every token is classified in one pass
+    """
+    id = post_field(row._c0)
+    url = post_field(row._c1)
+    comments = post_field(row._c2)
+    caption = post_field(row._c3)
+    tags = post_field(row._c4)
+    tokens = tknzr.tokenize(comments) + tknzr.tokenize(caption) + tknzr.tokenize(tags)
+    hashtags = []
+    links = []
+    emojis = []
+    userhandles = []
+    for token in tokens:
+        if token.startswith("#"):
+            hashtags.append(token)
+        elif token.startswith("@"):
+            userhandles.append(token)
+        if "liketk.it/" in token:
+            match = liketkit_re.search(token)
+            if match is not None:
+                links.append(match.group(0))
+        if token in emoji_table:
+            emojis.append(token)
+    segmenter = hashtag_segmenter.get(args.segmentcache, args.segmenter)
     segmented_hashtags = []
     styles = []
     for token in hashtags:
         if len(token) < 20:
-            seg = segment(token.strip("#"))
+            seg = segmenter.segment(token.strip("#"))
             if "style" in seg or "styles" in seg:
                 for w in seg:
                     if not w == "style" and not w == "styles":
                         styles.append((w, 100.0))
             segmented_hashtags.extend(seg)
-    if styles > 8:
-        styles = styles[0:8]
-    links = []
-    emojis = []
-    userhandles = []
-    for token in tokens:
-        match = re.search("http://liketk.it/([^\s]+)", token)
-        if match is not None:
-            link = match.group(0)
-            links.append(link)
-        if token in emoji.UNICODE_EMOJI:
-            emojis.append(token)
-        if token.startswith("@"):
-            userhandles.append(token)
-    text = tokens
-    comments = tknzr_strip_users.tokenize(comments)
-    caption = tknzr_strip_users.tokenize(caption)
-    tags = tknzr_strip_users.tokenize(tags)
+    styles = styles[0:8]
     img_name = url.rsplit('/', 1)[-1]
     image_path = args.imagepath + img_name
-    return pyspark.sql.Row(id=id, text=text, hashtags=hashtags, links=links,
-                           comments=comments, segmented_hashtags=segmented_hashtags,
-                           caption=caption, tags=tags, styles=styles, userhandles=userhandles, emojis=emojis, url=url,
-                           image_path=image_path)
+    return pyspark.sql.Row(id=id, text=tokens, hashtags=hashtags, links=links,
+                           comments=tknzr_strip_users.tokenize(comments), segmented_hashtags=segmented_hashtags,
+                           caption=tknzr_strip_users.tokenize(caption), tags=tknzr_strip_users.tokenize(tags),
+                           styles=styles, userhandles=userhandles, emojis=emojis, url=url, image_path=image_path)
 
 
-def analyze_user(information_extractor, sql, args):
+def analyze_user(extractor_config, sql, args):
     """ Analyzes a given user with semantic/syntactic similarities"""
     df = parse_raw(sql, args.input)
     count = df.count()
     print("number of posts: {0}".format(count))
+    if (args.resume):
+        analyze_user_checkpointed(extractor_config, df, args)
+        return
     rdd = df.rdd.repartition(args.partitions)
-    rdd = rdd.map(lambda x: premap_post(x, args))
-    rdd = rdd.repartition(args.partitions)
-    rdd = rdd.zipWithIndex()
+    rdd = rdd.mapPartitionsWithIndex(lambda partition, rows: map_partition(partition, rows, extractor_config, args))
+    df = sql.createDataFrame(rdd.map(result_values), result_schema)
+    if args.format == "parquet":
+        df.write.mode("overwrite").parquet(args.output)
+    else:
+        df.write.mode("overwrite").json(args.output)
+
+
+def result_values(row):
+    """ Values of a result row with the types of the result schema"""
+    values = row.asDict()
+    for field in classification_fields:
+        values[field] = dict((family, dict((label, float(score)) for label, score in classes.items()))
+                             for family, classes in values[field].items())
+    return values
+
+
+def analyze_user_checkpointed(extractor_config, df, args):
+    """
+    Analyzes the posts that are not in the output directory yet, the results of every partition are written
+    to checkpoint files (JSON lines, with the types of the result schema) as they are computed so that an
+    interrupted run can be resumed
+    """
+    done = df.rdd.context.broadcast(checkpoints.done_ids(args.output))
+    print("posts already analyzed: {0}".format(len(done.value)))
+    run = checkpoints.new_run()
+    rdd = df.rdd.filter(lambda row: row._c0 not in done.value)
     rdd = rdd.repartition(args.partitions)
-    rdd = rdd.map(lambda (x, index): map_post(x, information_extractor, index, args))
-    try:
-        rdd.toDF().toJSON().saveAsTextFile(args.output)
-    except:
-        rdd.saveAsTextFile(args.output)
+    rdd = rdd.mapPartitionsWithIndex(lambda partition, rows: checkpoints.write_partition(
+        (pyspark.sql.Row(**result_values(row)) for row in map_partition(partition, rows, extractor_config, args)),
+        args.output, run, partition, args.checkpointevery))
+    print("posts analyzed: {0}".format(rdd.sum()))
 
 
 def main():
     """ Program entrypoint, orchestrates the pipeline"""
     args = parse_args()
-    tfidf = create_tf_idf(args.input)
-    information_extractor = InformationExtractor(args.vectors, read_gazetter(args.brands), read_gazetter(args.styles),
-                                                 read_gazetter(args.materials), read_gazetter(args.items),
-                                                 read_gazetter(args.probasebrands),
-                                                 read_gazetter(args.probasematerials), read_gazetter(args.patterns),
-                                                 read_gazetter(args.itemtopcategory), args.deepdetect, args.conf, tfidf)
     sc = pyspark.SparkContext(conf=sparkConf())
     sql = pyspark.SQLContext(sc)
-    analyze_user(information_extractor, sql, args)
+    if (args.presegment):
+        segmented = hashtag_segmenter.get(args.segmentcache, args.segmenter).presegment(corpus_hashtags(args.input))
+        print("hashtags segmented: {0}".format(segmented))
+    tfidf = sc.broadcast(create_tf_idf(args.input, args.tfidfstore, args.tfidfcheck))
+    extractor_config = ExtractorConfig(args.vectors, read_gazetter(args.brands), read_gazetter(args.styles),
+                                       read_gazetter(args.materials), read_gazetter(args.items),
+                                       read_gazetter(args.probasebrands),
+                                       read_gazetter(args.probasematerials), read_gazetter(args.patterns),
+                                       read_gazetter(args.itemtopcategory), args.deepdetect, args.conf, tfidf)
+    # Converts the vectors and compiles the gazetteer index on a first run before the executors load them,
+    # and starts the DeepDetect services once
+    extractor_config.create(startup_services=True)
+    analyze_user(extractor_config, sql, args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pickle
+import numpy as np
+
+"""
+Compiled domain lists (gazetteers) for the text clustering.
+
+Every domain list is decoded, lowercased, lemmatized and looked up in the word vectors once, when the extractor
+is constructed, instead of once per token and entry of every post. The compiled index is persisted to disk, keyed
+on the word vectors file and the content of the domain lists, so that workers reload it instead of recomputing it.
+"""
+
+# Bump when the pickled layout of the index changes
+INDEX_VERSION = 1
+
+
+class Gazetteer(object):
+    """
+    A compiled domain list.
+    Flat lists have one lemma per entry. Hierarchical lists ("label,word word ...") have one lemma per word,
+    word_labels maps each word to the index of its label in labels.
+    """
+
+    def __init__(self, entries, words, matrix, labels=None, word_labels=None):
+        self.entries = entries
+        self.words = words
+        self.matrix = matrix
+        self.labels = labels
+        self.word_labels = word_labels
+
+    def hierarchical(self):
+        """ Whether the domain list maps labels to several words"""
+        return self.labels is not None
+
+    def label_starts(self):
+        """ Index of the first word of every label, the words of a label are contiguous"""
+        return np.flatnonzero(np.r_[True, self.word_labels[1:] != self.word_labels[:-1]])
+
+
+class GazetteerIndex(object):
+    """ Compiled domain lists by name, also addressable by the raw list they were compiled from"""
+
+    def __init__(self, gazetteers, raw_lists):
+        self.gazetteers = gazetteers
+        self.by_content = {}
+        for name, raw in raw_lists.iteritems():
+            self.add(raw, gazetteers[name])
+
+    def __getitem__(self, name):
+        return self.gazetteers[name]
+
+    def lookup(self, raw, hierarchical):
+        """ The compiled gazetteer for a raw domain list, None if it is not in the index"""
+        return self.by_content.get((hierarchical, tuple(raw)))
+
+    def add(self, raw, gazetteer):
+        """ Register a compiled gazetteer under the raw domain list it was compiled from"""
+        self.by_content[(gazetteer.hierarchical(), tuple(raw))] = gazetteer
+
+    def save(self, path):
+        """ Atomically write the index to path"""
+        tmp_path = path + ".tmp" + str(os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=2)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """ Read an index written with save"""
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def compile_gazetteer(raw, hierarchical, lemmatize, topic_matrix):
+    """ Decode, lowercase and lemmatize a domain list and look up its lemmas in the word vectors"""
+    entries = map(lambda x: x.decode('utf-8', 'ignore').encode("utf-8"), raw)
+    if not hierarchical:
+        return Gazetteer(entries, entries, topic_matrix(map(lambda x: lemmatize(x.lower()), entries)))
+    labels = []
+    words = []
+    word_labels = []
+    for x in entries:
+        parts = x.split(",")
+        labels.append(parts[0])
+        for word in parts[1].split(" "):
+            words.append(word.lower())
+            word_labels.append(len(labels) - 1)
+    matrix = topic_matrix(map(lemmatize, words))
+    return Gazetteer(entries, words, matrix, labels, np.array(word_labels, dtype=np.int64))
+
+
+def fingerprint(vectors_path, domain_lists):
+    """
+    Key of a compiled index: the word vectors file (path, size and modification time, hashing a multi-GB
+    file on every start would defeat the purpose) and the full content of the domain lists
+    """
+    sha = hashlib.sha1()
+    sha.update(str(INDEX_VERSION))
+    stat = os.stat(vectors_path)
+    sha.update("{0}:{1}:{2}".format(os.path.abspath(vectors_path), stat.st_size, int(stat.st_mtime)))
+    for name in sorted(domain_lists.keys()):
+        raw, hierarchical = domain_lists[name]
+        sha.update("\n#{0}:{1}\n".format(name, hierarchical))
+        sha.update("\n".join(raw))
+    return sha.hexdigest()
+
+
+def load_or_build(index_dir, vectors_path, domain_lists, lemmatize, topic_matrix):
+    """
+    Load the compiled index of the domain lists from index_dir, or compile and save it if there is none.
+    domain_lists maps names to (raw list, hierarchical), an empty index_dir disables persistence.
+    """
+    raw_lists = dict((name, raw) for name, (raw, hierarchical) in domain_lists.iteritems())
+    path = None
+    if index_dir != "":
+        path = os.path.join(index_dir, "gazetteers_" + fingerprint(vectors_path, domain_lists) + ".pkl")
+        if os.path.exists(path):
+            return GazetteerIndex.load(path)
+    gazetteers = {}
+    for name, (raw, hierarchical) in domain_lists.iteritems():
+        gazetteers[name] = compile_gazetteer(raw, hierarchical, lemmatize, topic_matrix)
+    index = GazetteerIndex(gazetteers, raw_lists)
+    if path is not None:
+        if not os.path.exists(index_dir):
+            try:
+                os.makedirs(index_dir)
+            except OSError:
+                # Created concurrently by another worker
+                pass
+        index.save(path)
+    return index
@@ -0,0 +1,159 @@
+import math
+import threading
+
+import wordsegment
+
+import lru_cache
+import persistent_cache
+
+"""
+Segmentation of hashtags into words (#fashionblogger -> fashion blogger), memoized.
+
+The same hashtags repeat across millions of posts, so segmentations are kept in memory and in a persistent cache
+(SQLite) shared across runs, which can be filled up front with the distinct hashtags of a corpus (presegment).
+Two backends give the same segmentations: "wordsegment" calls wordsegment.segment, "fast" runs the same
+search over the same unigram/bigram scores bottom-up instead of recursively. The persistent cache keys are
+prefixed with the backend, so a cache file shared by both backends keeps their segmentations apart.
+"""
+
+BACKENDS = ["wordsegment", "fast"]
+
+# New segmentations are written to the persistent cache in batches of this size
+FLUSH_EVERY = 1000
+
+
+class FastSegmenter(object):
+    """
+    wordsegment's segmentation computed bottom-up: the best segmentation of every suffix of the text after every
+    possible previous word, from the shortest suffix to the whole text. Scores and ties are handled exactly like
+    wordsegment's recursive search, so the segmentations are the same. A word scores the same after every previous
+    word that has no bigram with it, so most previous words share one search per suffix
+    """
+
+    def __init__(self, segmenter):
+        self.segmenter = segmenter
+        # Words that have a bigram score after a previous word
+        self.followers = {}
+        for bigram in segmenter.bigrams:
+            previous, word = bigram.split(" ", 1)
+            if previous in segmenter.unigrams:
+                self.followers.setdefault(previous, set()).add(word)
+
+    def search(self, text):
+        """ (score, words) of the best segmentation of text"""
+        n = len(text)
+        if n == 0:
+            return 0.0, []
+        limit = self.segmenter.limit
+        score = self.segmenter.score
+        best = [None] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            prefixes = [text[i:i + k] for k in range(1, min(n - i, limit) + 1)]
+            suffixes = [best[i + len(prefix)][prefix] if i + len(prefix) < n else (0.0, []) for prefix in prefixes]
+            # Best segmentation after a previous word without bigrams with the prefixes (unigram scores)
+            unigram_scores = [math.log10(score(prefix)) for prefix in prefixes]
+            unigram_best = self.best(prefixes, suffixes, unigram_scores)
+            best[i] = {}
+            previous_words = ['<s>'] if i == 0 else [text[j:i] for j in range(max(0, i - limit), i)]
+            for previous in previous_words:
+                followers = self.followers.get(previous)
+                if followers is not None and any(prefix in followers for prefix in prefixes):
+                    prefix_scores = [math.log10(score(prefix, previous)) if prefix in followers else unigram_score
+                                     for prefix, unigram_score in zip(prefixes, unigram_scores)]
+                    best[i][previous] = self.best(prefixes, suffixes, prefix_scores)
+                else:
+                    best[i][previous] = unigram_best
+        return best[0]['<s>']
+
+    def best(self, prefixes, suffixes, prefix_scores):
+        """ Max of the (score, words) candidates, like max() over the candidates of wordsegment's search"""
+        best_score = None
+        best_words = None
+        for prefix, (suffix_score, suffix_words), prefix_score in zip(prefixes, suffixes, prefix_scores):
+            candidate = prefix_score + suffix_score
+            if best_score is None or candidate > best_score or \
+                    (candidate == best_score and [prefix] + suffix_words > best_words):
+                best_score = candidate
+                best_words = [prefix] + suffix_words
+        return best_score, best_words
+
+    def segment(self, text):
+        """ Words of the best segmentation of text, in chunks like wordsegment.isegment"""
+        clean_text = self.segmenter.clean(text)
+        size = 250
+        prefix = ''
+        words = []
+        for offset in range(0, len(clean_text), size):
+            chunk = clean_text[offset:(offset + size)]
+            _, chunk_words = self.search(prefix + chunk)
+            prefix = ''.join(chunk_words[-5:])
+            words.extend(chunk_words[:-5])
+        _, prefix_words = self.search(prefix)
+        return words + prefix_words
+
+
+class HashtagSegmenter(object):
+    """ Segments hashtags (without #), memoized in memory and in a persistent cache (in memory if cache_path is "")"""
+
+    def __init__(self, cache_path="", backend="wordsegment", memo_size=100000):
+        if len(wordsegment.UNIGRAMS) == 0:
+            wordsegment.load()
+        if backend == "fast":
+            self.backend = FastSegmenter(wordsegment._segmenter).segment
+        else:
+            self.backend = wordsegment.segment
+        self.cache = persistent_cache.PersistentCache(cache_path, None, None)
+        self.key_prefix = backend + "|"
+        self.memo = lru_cache.LRUCache(memo_size)
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def segment(self, hashtag):
+        """ Words of the hashtag"""
+        return self.memo.get(hashtag, self.lookup, hashtag)
+
+    def lookup(self, hashtag):
+        """ Segmentation from the persistent cache, computed and queued for the cache on a miss"""
+        cached = self.cache.get(self.key(hashtag))
+        if cached is not None:
+            return cached[1]
+        words = self.backend(hashtag)
+        with self.lock:
+            self.pending.append((self.key(hashtag), words))
+            flush = len(self.pending) >= FLUSH_EVERY
+        if flush:
+            self.flush()
+        return words
+
+    def key(self, hashtag):
+        """ Key of a hashtag in the persistent cache"""
+        return self.key_prefix + hashtag
+
+    def flush(self):
+        """ Write the queued segmentations to the persistent cache"""
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+        if len(pending) > 0:
+            self.cache.put_many(pending)
+
+    def presegment(self, hashtags):
+        """ Segment the distinct hashtags that are not in the persistent cache yet, returns their number"""
+        new = [hashtag for hashtag in set(hashtags) if self.cache.get(self.key(hashtag)) is None]
+        for start in range(0, len(new), FLUSH_EVERY):
+            self.cache.put_many([(self.key(hashtag), self.backend(hashtag))
+                                 for hashtag in new[start:start + FLUSH_EVERY]])
+        return len(new)
+
+
+# Segmenters of the process (e.g. a Spark executor), by cache path and backend
+segmenters = {}
+segmenters_lock = threading.Lock()
+
+
+def get(cache_path="", backend="wordsegment"):
+    """ The HashtagSegmenter of the process for a cache path and backend, created on first use"""
+    with segmenters_lock:
+        if (cache_path, backend) not in segmenters:
+            segmenters[(cache_path, backend)] = HashtagSegmenter(cache_path, backend)
+        return segmenters[(cache_path, backend)]
@@ -0,0 +1,35 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+"""
+Pooled HTTP sessions for the clients of external services (DeepDetect, Deepomatic).
+
+A session keeps its connections alive and reuses them across requests, instead of a new TCP connection
+(and TLS handshake) per request. Connection errors and 429/5xx responses of idempotent requests are retried with
+exponential backoff.
+"""
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.3
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry(retries, backoff):
+    """
+    Retry policy of the idempotent HTTP methods (urllib3's default set, not POST), the last response is returned
+    when the retries are exhausted. A POST (e.g. a Deepomatic or DeepDetect request that starts a task) is not
+    sent again after the server may have accepted it, only when the connection could not be established
+    """
+    return Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+
+
+def session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """ Session with pool_size kept-alive connections per host and retries with backoff"""
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry(retries, backoff))
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
@@ -2,15 +2,14 @@
 
 import json
 from InformationExtraction import InformationExtractor
-from wordsegment import load, segment
+import hashtag_segmenter
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import TweetTokenizer
 import rankings_helper
 import argparse
 import numpy as np
 from ekphrasis.classes.segmenter import Segmenter
-from gensim.models import TfidfModel
-from gensim.corpora import Dictionary
+from tfidf_index import TfidfIndex
 from nltk.corpus import stopwords
 import logging
 from scipy import stats
@@ -23,7 +22,7 @@ Requires ground-truth labels for the evaluation.
 
 tknzr = TweetTokenizer(strip_handles=False, reduce_len=True)
 tknzr_strip_users = TweetTokenizer(strip_handles=True, reduce_len=True)
-load()
+segmenter = hashtag_segmenter.get()
 # seg_ig = Segmenter(corpus="ig_corpus")
 wordnet_lemmatizer = WordNetLemmatizer()
 stop_words = set(stopwords.words('english'))
@@ -173,20 +172,8 @@ def create_tf_idf(x, numX):
     Compute the TF-IDF scores based on the entire corpus
     but only return the first numX documents, as those have labels to be used for evaluation
     """
-    dct = Dictionary(x)
-    corpus = [dct.doc2bow(line) for line in x]
-    model = TfidfModel(corpus)
-    tfidf_factors = {}
-    for i, doc in enumerate(corpus):
-        temp = {}
-        for id, value in model[doc]:
-            word = dct.get(id)
-            temp[word] = value
-        tfidf_factors[i] = temp
-    tfidf_factors_subset = {}
-    for i in range(0, numX):
-        tfidf_factors_subset[i] = tfidf_factors[i]
-    return tfidf_factors_subset
+    tfidf = TfidfIndex.build(lambda: enumerate(x))
+    return tfidf.restrict(range(0, numX))
 
 
 def clean_text(text):
@@ -262,7 +249,7 @@ def extract_features(labelsPath, featuresPath):
         segmented_hashtags = []
         for token in hashtags:
             if len(token) < 20:
-                seg = segment(token.strip("#"))
+                seg = segmenter.segment(token.strip("#"))
                 # seg = seg_ig.segment(token.strip("#"))
                 segmented_hashtags.extend(seg)
         comments = tknzr_strip_users.tokenize(" ".join(comments))
@@ -284,7 +271,7 @@ def extract_features(labelsPath, featuresPath):
             segmented_hashtags = []
             for token in hashtags:
                 if len(token) < 20:
-                    seg = segment(token.strip("#"))
+                    seg = segmenter.segment(token.strip("#"))
                     # seg = seg_ig.segment(token.strip("#"))
                     segmented_hashtags.extend(seg)
             x_data_all.append(comments + caption + tags + segmented_hashtags + hashtags)
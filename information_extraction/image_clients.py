@@ -0,0 +1,112 @@
+import threading
+
+from clarifai.rest import ClarifaiApp
+from clarifai.rest import Image as ClImage
+from google.cloud import vision
+from google.cloud.vision import types
+
+"""
+Clients of the Google Vision and Clarifai image classification APIs, and batched lookups.
+
+The clients are created once per process (e.g. a Spark executor) and reused for every image, instead of a new client
+(and for Clarifai, a lookup of the model) per image. The images of many posts are classified with multi-image
+requests: batch_annotate_images for Google Vision and multi-input predict for Clarifai, of at most the number of
+images each service accepts per request.
+"""
+
+# Images per request accepted by the services
+VISION_MAX_BATCH = 16
+CLARIFAI_MAX_BATCH = 128
+
+# Clients of the process, by credentials
+vision_clients = {}
+clarifai_models = {}
+clients_lock = threading.Lock()
+
+
+def vision_client():
+    """ Google Vision client of the process (credentials from the environment), created on first use"""
+    with clients_lock:
+        if "default" not in vision_clients:
+            vision_clients["default"] = vision.ImageAnnotatorClient()
+        return vision_clients["default"]
+
+
+def clarifai_model(api_key):
+    """ Clarifai apparel model of the process for an API key, created on first use"""
+    with clients_lock:
+        if api_key not in clarifai_models:
+            clarifai_models[api_key] = ClarifaiApp(api_key=api_key).models.get('apparel')
+        return clarifai_models[api_key]
+
+
+def chunks(items, size):
+    """ Consecutive chunks of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def vision_labels(client, contents, batch_size=VISION_MAX_BATCH):
+    """
+    (description, score) labels of every image (bytes, None for a missing image), with batch_annotate_images
+    requests of at most batch_size images. The images of a failed request or response have no labels
+    """
+    labels = [[] for content in contents]
+    images = [(i, content) for i, content in enumerate(contents) if content is not None]
+    for chunk in chunks(images, max(1, min(batch_size, VISION_MAX_BATCH))):
+        features = [types.Feature(type=vision.enums.Feature.Type.LABEL_DETECTION)]
+        annotate_requests = [types.AnnotateImageRequest(image=types.Image(content=content), features=features)
+                             for i, content in chunk]
+        try:
+            responses = client.batch_annotate_images(annotate_requests).responses
+        except Exception as e:
+            print("error in google vision lookup: {0}".format(e))
+            continue
+        for (i, content), response in zip(chunk, responses):
+            if response.error.code != 0:
+                print("error in google vision lookup: {0}".format(response.error.message))
+                continue
+            labels[i] = [(label.description, label.score) for label in response.label_annotations]
+    return labels
+
+
+def clarifai_concepts(model, urls, batch_size=CLARIFAI_MAX_BATCH):
+    """
+    (word, value) concepts of every image url, with multi-input predict requests of at most batch_size images.
+    Outputs are matched to the images by url, by position if they have none. The images of a failed request are
+    retried one per request, an image whose own request fails has no concepts
+    """
+    concepts = []
+    for chunk in chunks(urls, max(1, min(batch_size, CLARIFAI_MAX_BATCH))):
+        try:
+            outputs = model.predict([ClImage(url=url) for url in chunk])[u"outputs"]
+        except Exception as e:
+            print("error in clarifai lookup: {0}".format(e))
+            if len(chunk) > 1:
+                # e.g. one bad url fails the whole request
+                concepts.extend(clarifai_concepts(model, chunk, 1))
+            else:
+                concepts.append([])
+            continue
+        by_url = {}
+        for output in outputs:
+            url = output.get(u"input", {}).get(u"data", {}).get(u"image", {}).get(u"url")
+            if url is not None:
+                by_url[url] = output_concepts(output)
+        for i, url in enumerate(chunk):
+            if url in by_url:
+                concepts.append(by_url[url])
+            elif len(by_url) == 0 and i < len(outputs):
+                concepts.append(output_concepts(outputs[i]))
+            else:
+                concepts.append([])
+    return concepts
+
+
+def output_concepts(output):
+    """ (word, value) of every word of the concepts of a Clarifai output"""
+    candidates = []
+    for concept in output.get(u"data", {}).get(u"concepts", []):
+        val = concept[u"value"]
+        for part in concept[u"name"].encode("utf-8").split(" "):
+            candidates.append((part, val))
+    return candidates
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Benchmark of the batched Google Vision, Clarifai and Deepomatic lookups against the fake services.
+
+Starts fake_services.py with a latency per request and classifies synthetic images with image_clients.vision_labels
+and image_clients.clarifai_concepts, one image per request and in batches, reporting images/sec. The Google Vision
+client (gRPC) and the Clarifai model are replaced by clients of the REST API of the fake services, which have the
+methods used by image_clients. Deepomatic detections (tasks that take tasktime seconds) are run one task at a time,
+polled every 100ms (the former lookup), and with deepomatic_tasks.TaskManager with many tasks in flight.
+
+  python image_services_bench.py --images 256 --latency 0.05 --tasktime 0.5
+"""
+
+import argparse
+import base64
+import time
+
+import deepomatic
+import deepomatic_tasks
+import fake_services
+import http_session
+import image_clients
+
+
+class Record(object):
+    """ Object with the given attributes, like the protobuf messages of the Google Vision client"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class RestVisionClient(object):
+    """ batch_annotate_images of the Google Vision client over the REST API at url"""
+
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+
+    def batch_annotate_images(self, requests):
+        body = {"requests": [{"image": {"content": base64.b64encode(request.image.content)},
+                              "features": [{"type": "LABEL_DETECTION"}]} for request in requests]}
+        response = self.session.post(self.url + "/v1/images:annotate", json=body)
+        response.raise_for_status()
+        responses = []
+        for annotation in response.json()["responses"]:
+            error = annotation.get("error", {})
+            labels = [Record(description=label["description"], score=label["score"])
+                      for label in annotation.get("labelAnnotations", [])]
+            responses.append(Record(error=Record(code=error.get("code", 0), message=error.get("message", "")),
+                                    label_annotations=labels))
+        return Record(responses=responses)
+
+
+class RestClarifaiModel(object):
+    """ Multi-input predict of the Clarifai apparel model over the REST API at url"""
+
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+
+    def predict(self, images):
+        body = {"inputs": [{"data": {"image": {"url": image.url}}} for image in images]}
+        response = self.session.post(self.url + "/v2/models/apparel/outputs", json=body)
+        response.raise_for_status()
+        return response.json()
+
+
+def single_task_detections(client, links):
+    """ Detections of the images one task at a time, polled every 100ms at most 10 times (the former lookup)"""
+    detections = []
+    for link in links:
+        task_id = client.helper.get("/detect/fashion/", params={"url": link})[u"task_id"]
+        candidates = []
+        for i in range(10):
+            time.sleep(0.1)
+            task = client.retrieveTask(task_id)[u"task"]
+            if task[u"status"] == u"success":
+                candidates = deepomatic_tasks.detection_candidates(task)
+                break
+        detections.append(candidates)
+    return detections
+
+
+def bench(name, fn, images, batch_size, unit="image(s) per request"):
+    """ Classify the images in batches of batch_size, prints and returns the images/sec"""
+    start = time.time()
+    results = fn(images, batch_size)
+    elapsed = time.time() - start
+    assert len(results) == len(images)
+    print("{0}, {1} {2}: {3:.1f}s, {4:.1f} images/s".format(name, batch_size, unit, elapsed,
+                                                             len(images) / elapsed))
+    return len(images) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Google Vision/Clarifai/Deepomatic batching benchmark')
+    parser.add_argument("-n", "--images", help="number of synthetic images", type=int, default=256)
+    parser.add_argument("-l", "--latency", help="seconds per request to the fake services", type=float, default=0.05)
+    parser.add_argument("-t", "--tasktime", help="seconds until a fake Deepomatic task is done", type=float,
+                        default=0.5)
+    parser.add_argument("-p", "--port", help="port of the fake services", type=int, default=8898)
+    args = parser.parse_args()
+    server = fake_services.start(args.port, {}, "", args.latency, args.tasktime)
+    url = "http://localhost:{0}".format(args.port)
+    session = http_session.session()
+    vision = RestVisionClient(url, session)
+    clarifai = RestClarifaiModel(url, session)
+    deepomatic_client = deepomatic.Client(0, "", host=url)
+    contents = ["image {0}".format(i) * 100 for i in range(args.images)]
+    links = ["http://images.example.com/{0}.jpg".format(i) for i in range(args.images)]
+    try:
+        for batch_size in [1, image_clients.VISION_MAX_BATCH]:
+            bench("Google Vision", lambda images, size: image_clients.vision_labels(vision, images, size),
+                  contents, batch_size)
+        for batch_size in [1, 32, image_clients.CLARIFAI_MAX_BATCH]:
+            bench("Clarifai", lambda images, size: image_clients.clarifai_concepts(clarifai, images, size),
+                  links, batch_size)
+        bench("Deepomatic, polled every 100ms", lambda images, size: single_task_detections(deepomatic_client, images),
+              links, 1, "task(s) in flight")
+        for max_in_flight in [1, deepomatic_tasks.DEFAULT_MAX_IN_FLIGHT]:
+            manager = deepomatic_tasks.TaskManager(deepomatic_client, max_in_flight=max_in_flight)
+            bench("Deepomatic task manager", lambda images, size: manager.detect_all(images), links, max_in_flight,
+                  "task(s) in flight")
+    finally:
+        deepomatic_client.helper.session.close()
+        session.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+from collections import deque
+
+"""
+Matching of many keywords in a text in one scan, with an Aho-Corasick automaton.
+
+`keyword in text` for every keyword scans the text once per keyword, the automaton scans it once for all of
+them: search stops at the first keyword that occurs, find_all returns every occurrence with its position.
+A keyword matches wherever it occurs as a substring, like `in`. Exact matches of whole words or keys (e.g. the
+concepts of a Probase result) are looked up in a set of the keywords.
+"""
+
+# Up to this many keywords, matches scans the text once per keyword (in C) instead of running the automaton
+# (in Python), which is faster for short keyword lists
+SCAN_LIMIT = 300
+
+
+class KeywordMatcher(object):
+    """ Aho-Corasick automaton of a list of keywords"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self.keyword_set = frozenset(self.keywords)
+        # Transitions, failure link, a keyword ending at every state and all keywords ending at every state
+        # (directly or through failure links)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        self.outputs = [()]
+        for keyword in self.keywords:
+            self.add(keyword)
+        self.link()
+
+    def add(self, keyword):
+        state = 0
+        for c in keyword:
+            if c not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.outputs.append(())
+                self.goto[state][c] = len(self.goto) - 1
+            state = self.goto[state][c]
+        if self.output[state] is None:
+            self.output[state] = keyword
+            self.outputs[state] = (keyword,)
+
+    def link(self):
+        """ Failure links in breadth-first order, states inherit the keywords of their failure state"""
+        queue = deque(self.goto[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for c, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail != 0 and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(c, 0)
+                if self.output[next_state] is None:
+                    self.output[next_state] = self.output[self.fail[next_state]]
+                if self.fail[next_state] != 0:
+                    self.outputs[next_state] += self.outputs[self.fail[next_state]]
+                queue.append(next_state)
+
+    def search(self, text):
+        """ The first keyword (by end position) that occurs in text, None if none does"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        if output[0] is not None:
+            # The empty keyword
+            return output[0]
+        state = 0
+        for c in text:
+            while state != 0 and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+    def matches(self, text):
+        """ Whether any keyword occurs in text"""
+        if len(self.keywords) <= SCAN_LIMIT:
+            return any(keyword in text for keyword in self.keywords)
+        return self.search(text) is not None
+
+    def find_all(self, text):
+        """
+        (start position, keyword) of every occurrence of a keyword in text, by end position (the empty keyword,
+        which occurs at every position, first)
+        """
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        found = [(i, keyword) for i in range(len(text) + 1) for keyword in outputs[0]]
+        state = 0
+        for i, c in enumerate(text):
+            while state != 0 and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if state == 0:
+                # The empty keyword of the root is already found at every position
+                continue
+            for keyword in outputs[state]:
+                found.append((i + 1 - len(keyword), keyword))
+        return found
+
+    def match_set(self, text):
+        """ The keywords that occur in text"""
+        return set(keyword for i, keyword in self.find_all(text))
+
+    def exact_matches(self, words):
+        """ The words (e.g. the keys of a dict) that are keywords"""
+        return [word for word in words if word in self.keyword_set]
+
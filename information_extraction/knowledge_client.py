@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+
+import wikipedia
+from googlesearch.googlesearch import GoogleSearch
+
+from lookup_pool import LookupTimeout
+
+"""
+Client of the external knowledge sources used as distant supervision: Google Knowledge Graph, Wikipedia and
+Google Search.
+
+Responses are cached in a persistent cache (failed lookups too, for the negative TTL of the cache) and the calls
+to every source are rate limited with a token bucket. A lookup that fails for any reason counts as a miss. The
+Wikipedia pages of a search are fetched concurrently and a vote stops at the first page that matches a keyword,
+pages that were not fetched yet or failed are skipped.
+"""
+
+
+class TokenBucket(object):
+    """ Allows rate calls per second on average, in bursts of at most burst calls. No limit if rate is None"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Take a token, waits until one is available"""
+        if self.rate is None:
+            return
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class KnowledgeClient(object):
+    """
+    Cached, rate-limited lookups in Google Knowledge Graph, Wikipedia and Google Search.
+    rate_limits maps a source ("google_kg", "wikipedia", "google_search") to [calls per second, burst]
+    """
+
+    def __init__(self, cache, lookups, rate_limits, session, google_service_url, offline=False):
+        self.cache = cache
+        self.lookups = lookups
+        self.session = session
+        self.google_service_url = google_service_url
+        self.offline = offline
+        self.buckets = dict((source, TokenBucket(*limit)) for source, limit in rate_limits.items())
+        self.unlimited = TokenBucket(None)
+
+    def cached(self, source, key, fetch, *args):
+        """ Cached value of fetch(*args), a rate limited call to source on a miss. None if the lookup failed"""
+        key = json.dumps([source, key], sort_keys=True)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached[1]
+        if self.offline:
+            return None
+        self.buckets.get(source, self.unlimited).acquire()
+        try:
+            value = fetch(*args)
+        except Exception as e:
+            # Any error of the client libraries fails only this lookup
+            print("error in {0} lookup: {1}: {2}".format(source, key, e))
+            self.cache.put_failure(key)
+            return None
+        self.cache.put(key, value)
+        return value
+
+    def google_kg(self, params):
+        """ Results of a Google Knowledge Graph search, a dict per entity with its score and descriptions"""
+        # The API key is left out of the cache key
+        key = dict((name, value) for name, value in params.items() if name != "key")
+        return self.cached("google_kg", key, self.fetch_google_kg, params)
+
+    def fetch_google_kg(self, params):
+        response = self.session.get(self.google_service_url, params=params)
+        response.raise_for_status()
+        results = []
+        for element in response.json().get("itemListElement", []):
+            result = {}
+            if "resultScore" in element:
+                result["resultScore"] = element["resultScore"]
+            for field in ["detailedDescription", "description", "url"]:
+                if field in element.get("result", {}):
+                    result[field] = element["result"][field]
+            results.append(result)
+        return results
+
+    def wikipedia_search(self, query):
+        """ Titles of the Wikipedia pages of a search"""
+        return self.cached("wikipedia", ["search", query], wikipedia.search, query)
+
+    def wikipedia_page(self, title):
+        """ Lowercased content of a Wikipedia page"""
+        return self.cached("wikipedia", ["page", title], lambda: wikipedia.page(title).content.lower())
+
+    def wikipedia_vote(self, query, matcher):
+        """ 1 if a page of the Wikipedia search of query contains a keyword of the matcher, else 0.0"""
+        titles = self.wikipedia_search(query)
+        if titles is None:
+            return 0.0
+        stop = threading.Event()
+        pages = [self.lookups.submit("wikipedia", self.wikipedia_page_unless, title, stop) for title in titles]
+        try:
+            for page in pages:
+                try:
+                    content = page.result()
+                except LookupTimeout:
+                    continue
+                except Exception as e:
+                    print("error in wikipedia page lookup: {0}".format(e))
+                    continue
+                if content is not None and matcher.matches(content):
+                    return 1
+            return 0.0
+        finally:
+            stop.set()
+
+    def wikipedia_page_unless(self, title, stop):
+        """ Content of a page, None without fetching it if the vote has already stopped"""
+        if stop.is_set():
+            return None
+        return self.wikipedia_page(title)
+
+    def google_search(self, query):
+        """ Lowercased [title, text] of the results of a Google search"""
+        return self.cached("google_search", query, lambda: [[result.title.lower(), result.getText().lower()]
+                                                            for result in GoogleSearch().search(query).results])
+
+    def google_search_vote(self, query, matcher):
+        """ 1 if a result of the Google search of query contains a keyword of the matcher, else 0"""
+        results = self.google_search(query)
+        if results is None:
+            return 0
+        for title, text in results:
+            if matcher.matches(text) or matcher.matches(title):
+                return 1
+        return 0
@@ -0,0 +1,172 @@
+import Queue
+import atexit
+import json
+import threading
+from urlparse import urljoin
+
+from bs4 import BeautifulSoup
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from lookup_pool import LookupTimeout
+
+"""
+Scraping of liketoknow.it links: the product links of a liketk.it page and the text of the product pages.
+
+Pages are fetched over plain HTTP with a pooled session and parsed with BeautifulSoup. A liketk.it page whose
+products are only rendered with JavaScript is loaded in a bounded pool of reusable headless browsers (PhantomJS)
+instead, when the pool has browsers. The product pages of a link are fetched concurrently, every page load has a
+timeout, and the product links and page texts are cached by URL.
+"""
+
+DEFAULT_TIMEOUT = 20
+DEFAULT_MAX_PRODUCTS = 10
+
+
+def product_links(html, base_url):
+    """ Absolute links of the products of a liketk.it page, None if the page has no products element"""
+    products = BeautifulSoup(html, "lxml").find(class_="ltk-products")
+    if products is None:
+        return None
+    return [urljoin(base_url, element["href"]) for element in products.find_all(href=True)]
+
+
+def page_text(html):
+    """ The text nodes of a page"""
+    return [unicode(text) for text in BeautifulSoup(html, "lxml").findAll(text=True, recursive=True)]
+
+
+class HttpFetcher(object):
+    """ Fetches pages over plain HTTP"""
+
+    def __init__(self, session, timeout=DEFAULT_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+
+    def fetch(self, url):
+        """ HTML of a page, IOError (requests exceptions) if it cannot be fetched in time"""
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+
+class BrowserPool(object):
+    """ At most size headless browsers, created on first use and reused across pages, quit at exit"""
+
+    def __init__(self, size, timeout=DEFAULT_TIMEOUT, create=webdriver.PhantomJS):
+        self.size = size
+        self.timeout = timeout
+        self.create = create
+        self.idle = Queue.Queue()
+        self.created = 0
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def acquire(self):
+        """ An idle browser, a new one if there are less than size, else waits for one to be released"""
+        with self.lock:
+            new = self.idle.empty() and self.created < self.size
+            if new:
+                self.created += 1
+        if not new:
+            try:
+                return self.idle.get(True, self.timeout)
+            except Queue.Empty:
+                raise IOError("no browser available")
+        try:
+            driver = self.create()
+            driver.set_page_load_timeout(self.timeout)
+            return driver
+        except WebDriverException:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def discard(self, driver):
+        """ Quit a browser that failed, a new one is created in its place when needed"""
+        with self.lock:
+            self.created -= 1
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def fetch(self, url):
+        """ HTML of a page rendered in a browser of the pool"""
+        driver = self.acquire()
+        try:
+            driver.get(url)
+            html = driver.page_source
+        except WebDriverException:
+            self.discard(driver)
+            raise
+        self.idle.put(driver)
+        return html
+
+    def close(self):
+        """ Quit the idle browsers"""
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except Queue.Empty:
+                return
+            self.discard(driver)
+
+
+class LiketkitScraper(object):
+    """ Text of the product pages of liketk.it links, cached by URL"""
+
+    def __init__(self, http, browsers, cache, lookups, max_products=DEFAULT_MAX_PRODUCTS):
+        self.http = http
+        self.browsers = browsers
+        self.cache = cache
+        self.lookups = lookups
+        self.max_products = max_products
+
+    def cached(self, key, fetch, *args):
+        """ Cached value of fetch(*args), fetched on a miss. None if the fetch failed"""
+        key = json.dumps(key)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached[1]
+        try:
+            value = fetch(*args)
+        except (IOError, ValueError, WebDriverException):
+            print("error in liketkit scraping: {0}".format(key))
+            self.cache.put_failure(key)
+            return None
+        self.cache.put(key, value)
+        return value
+
+    def scrape(self, url):
+        """ Text of the product pages of a liketk.it link, the pages are fetched concurrently"""
+        links = self.cached(["products", url], self.fetch_products, url)
+        if links is None:
+            return []
+        pages = [self.lookups.submit("liketkit", self.product_text, link) for link in links[:self.max_products]]
+        text = []
+        for page in pages:
+            try:
+                page_text = page.result()
+            except LookupTimeout:
+                print("liketkit product page timed out")
+                continue
+            if page_text is not None:
+                text.extend(page_text)
+        return text
+
+    def fetch_products(self, url):
+        """
+        Product links of a liketk.it page, rendered in a browser if they are not in the HTML. ValueError if the
+        page has no products element, cached as a failure (negative TTL) since it may be rendered next time
+        """
+        links = product_links(self.http.fetch(url), url)
+        if links is None and self.browsers is not None:
+            links = product_links(self.browsers.fetch(url), url)
+        if links is None:
+            raise ValueError("no products element in " + url)
+        return links
+
+    def product_text(self, url):
+        """ Text of a product page"""
+        return self.cached(["page", url], lambda: page_text(self.http.fetch(url)))
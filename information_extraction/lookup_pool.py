@@ -0,0 +1,77 @@
+import threading
+import time
+
+"""
+Concurrent lookups of external services (image classification APIs, DeepDetect, ...).
+
+Every lookup runs in its own thread, so lookups can be nested (a lookup may start and wait for other lookups)
+without exhausting a fixed pool of workers. Each service has a limit on the number of concurrent calls to it
+(per process) and a timeout, counted from when the lookup is submitted. A lookup that times out keeps running
+in the background, but its result is no longer waited for.
+"""
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_CONCURRENCY = 4
+
+
+class LookupTimeout(Exception):
+    """ A lookup did not finish before the timeout of its service"""
+
+
+class Lookup(object):
+    """ A call to a service running in a thread"""
+
+    def __init__(self, service, fn, args, semaphore, timeout):
+        self.service = service
+        self.deadline = time.time() + timeout
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        thread = threading.Thread(target=self.run, args=(fn, args, semaphore))
+        thread.daemon = True
+        thread.start()
+
+    def run(self, fn, args, semaphore):
+        try:
+            with semaphore:
+                self.value = fn(*args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def result(self):
+        """ Value of the call, exceptions of the call are re-raised, LookupTimeout if it did not finish in time"""
+        if not self.done.wait(max(self.deadline - time.time(), 0)):
+            raise LookupTimeout("{0} lookup timed out".format(self.service))
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class LookupPool(object):
+    """ Starts lookups with per-service timeouts (seconds) and concurrency limits"""
+
+    def __init__(self, timeouts, concurrency):
+        self.timeouts = timeouts
+        self.concurrency = concurrency
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Semaphores are per process, they are created again after unpickling, e.g. on Spark executors
+        return {"timeouts": self.timeouts, "concurrency": self.concurrency}
+
+    def __setstate__(self, state):
+        self.__init__(state["timeouts"], state["concurrency"])
+
+    def semaphore(self, service):
+        """ Semaphore limiting the concurrent calls to a service"""
+        with self.lock:
+            if service not in self.semaphores:
+                self.semaphores[service] = threading.BoundedSemaphore(self.concurrency.get(service, DEFAULT_CONCURRENCY))
+            return self.semaphores[service]
+
+    def submit(self, service, fn, *args):
+        """ Start fn(*args) as a lookup of service, returns the Lookup to wait for its result"""
+        return Lookup(service, fn, args, self.semaphore(service), self.timeouts.get(service, DEFAULT_TIMEOUT))
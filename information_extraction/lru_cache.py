@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+"""
+Size-bounded least-recently-used cache with hit/miss counters, used to memoize lemmas and edit distances of
+tokens that repeat across posts.
+"""
+
+
+class LRUCache(object):
+    """ Maps keys to values, evicts the least recently used entry when maxsize is exceeded"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Entries and the lock are not shipped when pickled (e.g. to Spark executors), only the size
+        return {"maxsize": self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state["maxsize"])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, compute, *args):
+        """ Cached value of key, compute(*args) is called and cached on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                # Re-insert to mark as most recently used
+                value = self.entries.pop(key)
+                self.entries[key] = value
+                return value
+            self.misses += 1
+        value = compute(*args)
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        """ Hit and miss counts and the size of the cache"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": float(self.hits) / total if total > 0 else 0.0,
+            "size": len(self.entries),
+            "maxsize": self.maxsize
+        }
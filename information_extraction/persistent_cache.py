@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+"""
+Persistent key-value cache in a SQLite file, for responses of external services (e.g. Probase) that are looked up
+with the same parameters over and over, across posts and across runs.
+
+Entries expire after ttl seconds. Failed lookups are cached too (negative caching), for negative_ttl seconds,
+so that an unreachable service is not retried for every candidate. The cache can be warmed from (and dumped to)
+a file with one JSON object {"key": key, "value": value} per line, to run offline without any network calls.
+"""
+
+
+class PersistentCache(object):
+    """ Key-value cache in a SQLite file (in memory if path is ""), values are stored as JSON"""
+
+    def __init__(self, path, ttl, negative_ttl):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def __getstate__(self):
+        # The connection is opened again lazily after unpickling, e.g. on Spark executors
+        return {"path": self.path, "ttl": self.ttl, "negative_ttl": self.negative_ttl}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["ttl"], state["negative_ttl"])
+
+    def connection(self):
+        """ SQLite connection, the table is created on first use"""
+        if self.conn is None:
+            path = self.path
+            if path == "":
+                path = ":memory:"
+            elif os.path.dirname(path) != "" and not os.path.exists(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    # Created concurrently by another worker
+                    pass
+            self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cache "
+                              "(key TEXT PRIMARY KEY, value TEXT, ok INTEGER, created REAL)")
+            self.conn.commit()
+        return self.conn
+
+    def get(self, key):
+        """ (ok, value) of a cached entry that has not expired, ok is False for a cached failure. None on a miss"""
+        with self.lock:
+            row = self.connection().execute("SELECT value, ok, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value, ok, created = row
+                ttl = self.ttl if ok else self.negative_ttl
+                if ttl is None or time.time() - created < ttl:
+                    self.hits += 1
+                    return (bool(ok), json.loads(value) if ok else None)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """ Cache the value of a successful lookup"""
+        self.store(key, json.dumps(value), True)
+
+    def put_many(self, items):
+        """ Cache the values of many successful lookups, (key, value) pairs, in one transaction"""
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            conn.executemany("INSERT OR REPLACE INTO cache (key, value, ok, created) VALUES (?, ?, 1, ?)",
+                             [(key, json.dumps(value), now) for key, value in items])
+            conn.commit()
+
+    def put_failure(self, key):
+        """ Cache a failed lookup"""
+        self.store(key, None, False)
+
+    def store(self, key, value, ok):
+        with self.lock:
+            conn = self.connection()
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, ok, created) VALUES (?, ?, ?, ?)",
+                         (key, value, int(ok), time.time()))
+            conn.commit()
+
+    def warm(self, path):
+        """ Insert the entries of a file written with dump, returns the number of entries"""
+        count = 0
+        now = time.time()
+        with open(path, "r") as f, self.lock:
+            conn = self.connection()
+            for line in f:
+                if line.strip() == "":
+                    continue
+                entry = json.loads(line)
+                conn.execute("INSERT OR REPLACE INTO cache (key, value, ok, created) VALUES (?, ?, 1, ?)",
+                             (entry["key"], json.dumps(entry["value"]), now))
+                count += 1
+            conn.commit()
+        return count
+
+    def dump(self, path):
+        """ Write the successful entries to a file, one JSON object per line"""
+        with open(path, "w") as f, self.lock:
+            for key, value in self.connection().execute("SELECT key, value FROM cache WHERE ok = 1"):
+                f.write(json.dumps({"key": key, "value": json.loads(value)}) + "\n")
+
+    def stats(self):
+        """ Hit and miss counts"""
+        return {"hits": self.hits, "misses": self.misses}
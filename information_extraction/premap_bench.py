@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Benchmark of the text normalization of posts (premap_post) on a synthetic corpus.
+
+Runs fast_analysis.premap_post and the previous implementation, which tokenized the concatenated text and then
+every field again without username handles, on the same generated posts, and reports the time of both and the
+number of posts whose normalized fields differ. Hashtags are segmented (and memoized) before timing.
+
+  python premap_bench.py --posts 100000
+"""
+
+import argparse
+import random
+import re
+import time
+
+import emoji
+import pyspark.sql
+
+import fast_analysis
+import hashtag_segmenter
+
+WORDS = ["summer", "dress", "love", "this", "look", "outfit", "today", "new", "shoes", "bag", "denim", "jacket",
+         "wearing", "my", "favorite", "with", "the", "and", "so", "cute", "style", "fashion", "blogger", "ootd"]
+HASHTAGS = ["#ootd", "#fashionblogger", "#streetstyle", "#summerstyle", "#whatiwore", "#liketkit", "#denim",
+            "#bohostyle", "#instafashion", "#styleblogger", "#shoesoftheday", "#casualstyle"]
+HANDLES = ["@liketoknow.it", "@zara", "@hm", "@anna_fashion", "@style.daily", "@me"]
+# Handles glued to the previous token or to each other, whose stripping depends on the characters around them
+GLUED_HANDLES = [u"x@y", u"!@foo", u"@foo@bar", u"love@zara", u"(@hm)", u"mail:me@style.daily"]
+LINKS = ["http://liketk.it/2s7Vx", "http://liketk.it/2rJ1a", "https://www.instagram.com/p/abc/"]
+EMOJIS = [u"\U0001F60D", u"❤️", u"\U0001F44C", u"✨", u"\U0001F457"]
+
+
+def field(rnd, n):
+    """ Random text of n tokens"""
+    tokens = []
+    for i in range(n):
+        r = rnd.random()
+        if r < 0.6:
+            tokens.append(rnd.choice(WORDS))
+        elif r < 0.75:
+            tokens.append(rnd.choice(HASHTAGS))
+        elif r < 0.82:
+            tokens.append(rnd.choice(HANDLES))
+        elif r < 0.85:
+            tokens.append(rnd.choice(GLUED_HANDLES))
+        elif r < 0.92:
+            tokens.append(rnd.choice(EMOJIS))
+        else:
+            tokens.append(rnd.choice(LINKS))
+    return u" ".join(tokens)
+
+
+def corpus(n, seed=0):
+    """ n synthetic raw posts, like the rows of the CSV corpus"""
+    rnd = random.Random(seed)
+    return [pyspark.sql.Row(_c0=unicode(i), _c1=u"https://scontent.cdninstagram.com/img/" + unicode(i) + u".jpg",
+                            _c2=field(rnd, rnd.randint(0, 30)), _c3=field(rnd, rnd.randint(0, 30)),
+                            _c4=field(rnd, rnd.randint(0, 5))) for i in range(n)]
+
+
+def previous_premap_post(row, args):
+    """ premap_post before the single-pass normalization"""
+    if row._c0 is not None:
+        id = row._c0.encode('utf-8', 'ignore').decode("utf-8")
+    else:
+        id = ""
+    if row._c1 is not None:
+        url = row._c1.encode('utf-8', 'ignore').decode("utf-8")
+    else:
+        url = ""
+    if row._c2 is not None:
+        comments = row._c2.encode('utf-8', 'ignore').decode("utf-8")
+    else:
+        comments = ""
+    if row._c3 is not None:
+        caption = row._c3.encode('utf-8', 'ignore').decode("utf-8")
+    else:
+        caption = ""
+    if row._c4 is not None:
+        tags = row._c4.encode('utf-8', 'ignore').decode("utf-8")
+    else:
+        tags = ""
+    text = comments + caption + tags
+    tokens = fast_analysis.tknzr.tokenize(text)
+    hashtags = [x for x in tokens if x.startswith("#")]
+    segmented_hashtags = []
+    styles = []
+    for token in hashtags:
+        if len(token) < 20:
+            seg = hashtag_segmenter.get(args.segmentcache, args.segmenter).segment(token.strip("#"))
+            if "style" in seg or "styles" in seg:
+                for w in seg:
+                    if not w == "style" and not w == "styles":
+                        styles.append((w, 100.0))
+            segmented_hashtags.extend(seg)
+    if styles > 8:
+        styles = styles[0:8]
+    links = []
+    emojis = []
+    userhandles = []
+    for token in tokens:
+        match = re.search("http://liketk.it/([^\s]+)", token)
+        if match is not None:
+            link = match.group(0)
+            links.append(link)
+        if token in emoji.UNICODE_EMOJI:
+            emojis.append(token)
+        if token.startswith("@"):
+            userhandles.append(token)
+    text = tokens
+    comments = fast_analysis.tknzr_strip_users.tokenize(comments)
+    caption = fast_analysis.tknzr_strip_users.tokenize(caption)
+    tags = fast_analysis.tknzr_strip_users.tokenize(tags)
+    img_name = url.rsplit('/', 1)[-1]
+    image_path = args.imagepath + img_name
+    return pyspark.sql.Row(id=id, text=text, hashtags=hashtags, links=links,
+                           comments=comments, segmented_hashtags=segmented_hashtags,
+                           caption=caption, tags=tags, styles=styles, userhandles=userhandles, emojis=emojis, url=url,
+                           image_path=image_path)
+
+
+def bench(fn, posts, args):
+    """ Seconds to normalize the posts and the normalized posts"""
+    start = time.time()
+    rows = [fn(post, args) for post in posts]
+    return time.time() - start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='premap_post benchmark')
+    parser.add_argument("-n", "--posts", help="number of synthetic posts", type=int, default=100000)
+    parser.add_argument("-s", "--seed", help="seed of the synthetic corpus", type=int, default=0)
+    parser.add_argument("-sg", "--segmenter", help="hashtag segmentation backend", choices=hashtag_segmenter.BACKENDS,
+                        default="wordsegment")
+    args = parser.parse_args()
+    args.segmentcache = ""
+    args.imagepath = ""
+    posts = corpus(args.posts, args.seed)
+    segmenter = hashtag_segmenter.get(args.segmentcache, args.segmenter)
+    for hashtag in HASHTAGS:
+        segmenter.segment(hashtag.strip("#"))
+    previous_time, previous_rows = bench(previous_premap_post, posts, args)
+    time_, rows = bench(fast_analysis.premap_post, posts, args)
+    print("posts: {0}".format(len(posts)))
+    print("previous premap_post: {0:.2f}s ({1:.0f} posts/s)".format(previous_time, len(posts) / previous_time))
+    print("premap_post: {0:.2f}s ({1:.0f} posts/s)".format(time_, len(posts) / time_))
+    for name in ["text", "hashtags", "links", "emojis", "userhandles", "comments", "caption", "tags", "styles"]:
+        differ = sum(1 for previous, row in zip(previous_rows, rows) if getattr(previous, name) != getattr(row, name))
+        print("posts with different {0}: {1}".format(name, differ))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@
 
 $SPARK_HOME/bin/spark-submit \
 --master spark://limmen-MS-7823:7077 \
---py-files /media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/fast_analysis.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/InformationExtraction.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/deepomatic.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/dd_client.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/dd_bench.py \
+--py-files /media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/fast_analysis.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/InformationExtraction.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/deepomatic.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/dd_client.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/dd_bench.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/similarity_engine.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/gazetteer_index.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/vector_store.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/lru_cache.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/persistent_cache.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/lookup_pool.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/http_session.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/tfidf_index.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/checkpoints.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/hashtag_segmenter.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/keyword_matcher.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/knowledge_client.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/liketkit_scraper.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/image_clients.py,/media/limmen/HDD/workspace/fashion_rec/FashionRec/information_extraction/deepomatic_tasks.py \
 --conf spark.cores.max=8 \
 --conf spark.task.cpus=1 \
 --conf spark.executorEnv.JAVA_HOME="$JAVA_HOME" \
@@ -0,0 +1,233 @@
+import numpy as np
+
+"""
+Vectorized scoring of post tokens against a domain list (topic).
+
+All tokens of a post (every field, with a per-token weighting factor) are scored against all entries of a topic
+at once, with one of two strategies: SEMANTIC computes the same scores as InformationExtractor.token_similarity
+(cosine similarities from one matrix product of unit-normalized embeddings, edit distance as fallback)
+and SYNTACTIC the same as token_similarity_syntactic_only (edit distance only). The scores are then reduced
+per topic entry (flat_scores, top-num per token) or per label of a hierarchical topic (hierarchical_scores).
+"""
+
+# Lower bound of the TF-IDF weight of a token
+MIN_TFIDF = 0.0001
+
+# Factor boost when the token lemma and the topic lemma are identical
+EXACT_MATCH_BOOST = 10
+
+
+class TokenMatrix(object):
+    """
+    Lemmas, vocabulary rows, unit embeddings, TF-IDF weights and field factors of the tokens of a post,
+    tags marks the tokens that are user tags. ids and vectors are None when embeddings are not needed.
+    """
+
+    def __init__(self, lemmas, ids, vectors, weights, factors, tags):
+        self.lemmas = lemmas
+        self.ids = ids
+        self.vectors = vectors
+        self.weights = weights
+        self.factors = factors
+        self.tags = tags
+
+    def __len__(self):
+        return len(self.lemmas)
+
+    def rows(self, mask):
+        """ The tokens selected by a boolean mask"""
+        lemmas = [lemma for lemma, keep in zip(self.lemmas, mask) if keep]
+        ids = self.ids[mask] if self.ids is not None else None
+        vectors = self.vectors[mask] if self.vectors is not None else None
+        return TokenMatrix(lemmas, ids, vectors, self.weights[mask], self.factors[mask], self.tags[mask])
+
+
+class TopicMatrix(object):
+    """ Lemmas, vocabulary rows, unit embeddings and encoded characters of the entries of a topic """
+
+    def __init__(self, lemmas, ids, vectors):
+        self.lemmas = lemmas
+        self.ids = ids
+        self.vectors = vectors
+        self.codes, self.lengths = char_codes(lemmas)
+
+    def __len__(self):
+        return len(self.lemmas)
+
+
+def unit_vectors(vectors, dim):
+    """ Normalize the rows of a matrix to unit length like gensim's unitvec, rows of zeros are left as they are"""
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, dim)
+    norms = np.sqrt((vectors.astype(np.float64) ** 2).sum(axis=1))
+    norms[norms == 0] = 1.0
+    return vectors * (1.0 / norms).astype(np.float32)[:, None]
+
+
+def char_codes(words):
+    """ Encode words as a matrix of character codes padded with -1, and a vector of word lengths"""
+    lengths = np.array([len(word) for word in words], dtype=np.int64)
+    width = lengths.max() if len(words) > 0 else 0
+    codes = np.full((len(words), width), -1, dtype=np.int64)
+    for i, word in enumerate(words):
+        codes[i, :len(word)] = [ord(c) for c in word]
+    return codes, lengths
+
+
+def edit_distances(word, codes, lengths):
+    """
+    Levenshtein distance between word and each of the encoded words (same as nltk edit_distance),
+    the dynamic program is run for all encoded words at once, one row per character of word
+    """
+    n, width = codes.shape
+    offsets = np.arange(width + 1)
+    row = np.tile(offsets, (n, 1))
+    for i, c in enumerate(word):
+        cost = (codes != ord(c)).astype(np.int64)
+        new_row = np.empty_like(row)
+        new_row[:, 0] = i + 1
+        new_row[:, 1:] = np.minimum(row[:, 1:] + 1, row[:, :-1] + cost)
+        # Insertions: new_row[j] = min over k <= j of new_row[k] + (j - k)
+        row = np.minimum.accumulate(new_row - offsets, axis=1) + offsets
+    return row[np.arange(n), lengths]
+
+
+def edit_distance(word1, word2):
+    """
+    Levenshtein distance between two words (same as nltk edit_distance). The common prefix and suffix
+    do not change the distance and are skipped, the rest is computed keeping two rows of the dynamic program
+    """
+    if word1 == word2:
+        return 0
+    start = 0
+    end1 = len(word1)
+    end2 = len(word2)
+    while start < end1 and start < end2 and word1[start] == word2[start]:
+        start += 1
+    while end1 > start and end2 > start and word1[end1 - 1] == word2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    word1 = word1[start:end1]
+    word2 = word2[start:end2]
+    if len(word1) < len(word2):
+        word1, word2 = word2, word1
+    if len(word2) == 0:
+        return len(word1)
+    previous = list(range(len(word2) + 1))
+    for i, c1 in enumerate(word1):
+        current = [i + 1]
+        for j, c2 in enumerate(word2):
+            current.append(min(previous[j + 1] + 1, current[j] + 1, previous[j] + (c1 != c2)))
+        previous = current
+    return previous[-1]
+
+
+class SemanticStrategy(object):
+    """
+    token_similarity for every (token, topic entry) pair, tokens as rows and topic entries as columns.
+    Squared cosine similarity of the lemma embeddings (boosted on identical lemmas) when both lemmas have embeddings,
+    otherwise the inverse squared edit distance. Weighted by the TF-IDF of the token.
+    """
+    embeddings = True
+
+    def scores(self, tokens, topic):
+        factors = tokens.factors[:, None]
+        in_vocab = (tokens.ids >= 0)[:, None] & (topic.ids >= 0)[None, :]
+        cosine = np.dot(tokens.vectors, topic.vectors.T).astype(np.float64)
+        boosted = np.where(tokens.ids[:, None] == topic.ids[None, :], factors * EXACT_MATCH_BOOST, factors)
+        scores = np.where(in_vocab, boosted * cosine ** 2, 0.0)
+        distances = {}
+        for i in np.flatnonzero(~in_vocab.all(axis=1)):
+            cols = np.flatnonzero(~in_vocab[i])
+            # Which columns need edit distances only depends on the lemma, repeated tokens reuse them
+            if tokens.lemmas[i] not in distances:
+                distances[tokens.lemmas[i]] = edit_distances(tokens.lemmas[i], topic.codes[cols], topic.lengths[cols])
+            dist = tokens.factors[i] * distances[tokens.lemmas[i]]
+            scores[i, cols] = 1.0 / (1.0 + dist.astype(np.float64) ** 2)
+        return scores * tokens.weights[:, None]
+
+
+class SyntacticStrategy(object):
+    """
+    token_similarity_syntactic_only for every (token, topic entry) pair: the factor (boosted on identical lemmas)
+    over one plus the edit distance of the lemmas, weighted by the TF-IDF of the token.
+    """
+    embeddings = False
+
+    def scores(self, tokens, topic):
+        scores = np.empty((len(tokens), len(topic)))
+        distances = {}
+        for i, lemma in enumerate(tokens.lemmas):
+            if lemma not in distances:
+                distances[lemma] = edit_distances(lemma, topic.codes, topic.lengths)
+            dist = distances[lemma]
+            factors = np.where(dist == 0, tokens.factors[i] * EXACT_MATCH_BOOST, tokens.factors[i])
+            scores[i] = factors * (1.0 / (1.0 + dist))
+        return scores * tokens.weights[:, None]
+
+
+SEMANTIC = SemanticStrategy()
+SYNTACTIC = SyntacticStrategy()
+
+
+def flat_scores(tokens, topic, strategy, num):
+    """ Score of every topic entry: the sum of its scores over the tokens that have it among their num best"""
+    if len(tokens) == 0:
+        return np.zeros(len(topic))
+    scores = strategy.scores(tokens, topic)
+    return (scores * top_num_mask(scores, num)).sum(axis=0)
+
+
+def hierarchical_scores(tokens, topic, strategy, label_starts):
+    """
+    Score of every label of a hierarchical topic, whose words are the topic columns label_starts[i]:label_starts[i+1]:
+    the sum over the tokens of the best score of a word of the label. User tags also add their scores of every word
+    of the label.
+    """
+    if len(tokens) == 0:
+        return np.zeros(len(label_starts))
+    scores = strategy.scores(tokens, topic)
+    label_scores = np.maximum.reduceat(scores, label_starts, axis=1).sum(axis=0)
+    if tokens.tags.any():
+        label_scores += np.add.reduceat(scores[tokens.tags], label_starts, axis=1).sum(axis=0)
+    return label_scores
+
+
+def scatter_add(keys, scores):
+    """ Dict of the summed scores of every distinct key, in order of first occurrence"""
+    index = {}
+    ids = np.array([index.setdefault(key, len(index)) for key in keys], dtype=np.int64)
+    sums = np.bincount(ids, weights=scores, minlength=len(index)) if len(ids) > 0 else []
+    distinct = sorted(index.keys(), key=index.get)
+    freq_scores = {}
+    for key, score in zip(distinct, list(sums)):
+        freq_scores[key] = float(score)
+    return freq_scores
+
+
+def top_num_mask(scores, num):
+    """
+    Marks the num highest scores of every row. Ties are broken in favour of the lowest column,
+    which is the order a stable sort of the row would give.
+    """
+    rows, cols = scores.shape
+    if num <= 0:
+        return np.zeros(scores.shape, dtype=bool)
+    if num >= cols:
+        return np.ones(scores.shape, dtype=bool)
+    kth_cols = np.argpartition(-scores, num - 1, axis=1)[:, num - 1]
+    kth = scores[np.arange(rows), kth_cols][:, None]
+    above = scores > kth
+    tied = scores == kth
+    room = num - above.sum(axis=1)
+    return above | (tied & (np.cumsum(tied, axis=1) <= room[:, None]))
+
+
+def tfidf_weight(token, tfidf):
+    """ TF-IDF weight of a token, unicode tokens are looked up both as unicode and as utf-8"""
+    tfidf_score = 0.0
+    if token in tfidf:
+        tfidf_score = tfidf[token]
+    encoded = token if isinstance(token, bytes) else token.encode("utf-8")
+    if encoded in tfidf:
+        tfidf_score = tfidf[encoded]
+    return max(tfidf_score, MIN_TFIDF)
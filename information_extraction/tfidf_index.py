@@ -0,0 +1,246 @@
+import json
+import math
+import os
+import sqlite3
+from array import array
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+"""
+TF-IDF weights of the words of every post of a corpus, built in two streaming passes over the documents.
+
+The weights are the same as gensim's TfidfModel with its defaults: raw term counts times log2(N / df),
+L2-normalized per post, words that occur in every post are left out. A post id that occurs more than once in the
+corpus is counted once, with its first document. The term counts are stored in a CSR sparse matrix (a row per
+post, a column per word, words as unicode like gensim) together with the IDF of every word, instead of a dict of
+weights per post, so that the index is compact to keep in memory and to ship to Spark workers.
+index[post_id] computes the weights of a post: token in row, row[token].
+
+TfidfStore keeps the term counts and document frequencies in a SQLite file, so that new posts of a corpus
+are added without going over the posts that are already in it.
+"""
+
+# Weights at most this large are left out, like gensim
+EPS = 1e-12
+
+
+class TfidfIndex(object):
+    """ Sparse term counts of the posts and IDF of the words, with word -> column and post id -> row indexes"""
+
+    def __init__(self, counts, idfs, columns, rows):
+        self.counts = counts
+        self.idfs = idfs
+        self.columns = columns
+        self.rows = rows
+
+    @classmethod
+    def build(cls, documents):
+        """
+        Index of the documents, a function returning a new iterator of (post id, tokens) on every call.
+        Every post id is counted once, with its first document, like in TfidfStore.update.
+        The first pass counts the document frequencies, the second the terms of every post
+        """
+        columns = {}
+        df = array("l")
+        n = 0
+        for id, tokens in first_documents(documents()):
+            n += 1
+            # Columns are numbered like gensim's Dictionary, so that weights are summed in the same order
+            for token in sorted(set(map(to_unicode, tokens))):
+                if token not in columns:
+                    columns[token] = len(columns)
+                    df.append(0)
+                df[columns[token]] += 1
+        rows = {}
+        indptr = array("l", [0])
+        indices = array("l")
+        data = array("l")
+        for id, tokens in first_documents(documents()):
+            for col, count in sorted(count_columns(tokens, columns).items()):
+                indices.append(col)
+                data.append(count)
+            rows[id] = len(indptr) - 1
+            indptr.append(len(indices))
+        return cls(counts_matrix(indptr, indices, data, len(columns)), inverse_frequencies(df, n), columns, rows)
+
+    def restrict(self, ids):
+        """ Index of only the given posts, sharing the matrix"""
+        return TfidfIndex(self.counts, self.idfs, self.columns, dict((id, self.rows[id]) for id in ids))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, id):
+        return id in self.rows
+
+    def __getitem__(self, id):
+        return TfidfRow(self, self.rows[id])
+
+
+class TfidfRow(object):
+    """ Weights of the words of a post, a word that is not in the post has no weight"""
+
+    def __init__(self, index, row):
+        self.columns = index.columns
+        start = index.counts.indptr[row]
+        end = index.counts.indptr[row + 1]
+        cols = index.counts.indices[start:end]
+        self.weights = dict(post_weights(cols.tolist(), index.counts.data[start:end].tolist(),
+                                         index.idfs[cols].tolist()))
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __contains__(self, token):
+        return self.columns.get(token, -1) in self.weights
+
+    def __getitem__(self, token):
+        col = self.columns.get(token, -1)
+        if col not in self.weights:
+            raise KeyError(token)
+        return self.weights[col]
+
+    def get(self, token, default=None):
+        return self.weights.get(self.columns.get(token, -1), default)
+
+
+class TfidfStore(object):
+    """ Term counts of the posts and document frequencies of the words in a SQLite file, every post id once"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def connection(self):
+        """ SQLite connection, the tables are created on first use"""
+        if self.conn is None:
+            if os.path.dirname(self.path) != "" and not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, col INTEGER, df INTEGER)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS posts "
+                              "(id TEXT PRIMARY KEY, row INTEGER, cols TEXT, counts TEXT)")
+            self.conn.commit()
+        return self.conn
+
+    def ids(self):
+        """ Ids of the posts in the store"""
+        return set(id for (id,) in self.connection().execute("SELECT id FROM posts"))
+
+    def update(self, documents):
+        """
+        Add the documents, an iterator of (post id, tokens), of the posts that are not in the store yet (the first
+        document of a post id, like TfidfIndex.build). Only the new posts are counted, returns their number
+        """
+        conn = self.connection()
+        columns = dict(conn.execute("SELECT term, col FROM terms"))
+        known = self.ids()
+        row = len(known)
+        new_terms = []
+        df = {}
+        posts = []
+        for id, tokens in documents:
+            if id in known:
+                continue
+            known.add(id)
+            tokens = map(to_unicode, tokens)
+            for token in sorted(set(tokens)):
+                if token not in columns:
+                    columns[token] = len(columns)
+                    new_terms.append((token, columns[token]))
+                df[token] = df.get(token, 0) + 1
+            counts = sorted(count_columns(tokens, columns).items())
+            posts.append((id, row, json.dumps([col for col, count in counts]),
+                          json.dumps([count for col, count in counts])))
+            row += 1
+        conn.executemany("INSERT INTO terms (term, col, df) VALUES (?, ?, 0)", new_terms)
+        conn.executemany("UPDATE terms SET df = df + ? WHERE term = ?", [(freq, term) for term, freq in df.items()])
+        conn.executemany("INSERT INTO posts (id, row, cols, counts) VALUES (?, ?, ?, ?)", posts)
+        conn.commit()
+        return len(posts)
+
+    def index(self):
+        """ TfidfIndex of the posts in the store"""
+        conn = self.connection()
+        columns = {}
+        df = {}
+        for term, col, freq in conn.execute("SELECT term, col, df FROM terms"):
+            columns[term] = col
+            df[col] = freq
+        rows = {}
+        indptr = array("l", [0])
+        indices = array("l")
+        data = array("l")
+        for id, row, cols, counts in conn.execute("SELECT id, row, cols, counts FROM posts ORDER BY row"):
+            indices.extend(json.loads(cols))
+            data.extend(json.loads(counts))
+            rows[id] = row
+            indptr.append(len(indices))
+        df = [df[col] for col in range(len(columns))]
+        return TfidfIndex(counts_matrix(indptr, indices, data, len(columns)), inverse_frequencies(df, len(rows)),
+                          columns, rows)
+
+    def check(self, documents, tolerance=1e-9):
+        """
+        Consistency check against a full rebuild from the documents (a function returning a new iterator of
+        (post id, tokens)) with TfidfIndex.build, returns the ids of the posts whose weights differ
+        """
+        full = TfidfIndex.build(documents)
+        index = self.index()
+        full_terms = dict((col, term) for term, col in full.columns.items())
+        mismatches = [id for id in index.rows if id not in full]
+        for id in full.rows:
+            if id not in index:
+                mismatches.append(id)
+                continue
+            expected = full[id].weights
+            weights = index[id]
+            if len(expected) != len(weights) or any(
+                    abs(weights.get(full_terms[col], 0.0) - weight) > tolerance for col, weight in expected.items()):
+                mismatches.append(id)
+        return mismatches
+
+
+def to_unicode(token):
+    """ Tokens are decoded from utf-8 like in gensim's Dictionary"""
+    if isinstance(token, bytes):
+        return token.decode("utf-8")
+    return token
+
+
+def count_columns(tokens, columns):
+    """ Number of occurrences of every column (word) in the tokens"""
+    counts = {}
+    for token in map(to_unicode, tokens):
+        counts[columns[token]] = counts.get(columns[token], 0) + 1
+    return counts
+
+
+def counts_matrix(indptr, indices, data, width):
+    """ CSR matrix of the term counts of the posts"""
+    return csr_matrix((np.frombuffer(data, dtype=np.int_), np.frombuffer(indices, dtype=np.int_),
+                       np.frombuffer(indptr, dtype=np.int_)), shape=(len(indptr) - 1, width))
+
+
+def inverse_frequencies(df, n):
+    """ IDF of every column, log2 of the number of posts over the document frequency"""
+    return np.array([math.log(float(n) / freq, 2) for freq in df], dtype=np.float64)
+
+
+def post_weights(cols, counts, idfs):
+    """ (column, weight) of the terms of a post, computed like gensim's TfidfModel"""
+    weights = [(col, count * idf) for col, count, idf in zip(cols, counts, idfs) if abs(idf) > EPS]
+    length = math.sqrt(sum(weight ** 2 for col, weight in weights))
+    if length > 0.0:
+        weights = [(col, weight / length) for col, weight in weights]
+    return [(col, weight) for col, weight in weights if abs(weight) > EPS]
+
+
+def first_documents(documents):
+    """ The documents of the posts, skipping documents of a post id seen before"""
+    seen = set()
+    for id, tokens in documents:
+        if id not in seen:
+            seen.add(id)
+            yield id, tokens
@@ -0,0 +1,195 @@
+import argparse
+import mmap
+import os
+import numpy as np
+import similarity_engine
+
+"""
+Binary, memory-mapped store of word vectors.
+
+A text word vectors file (word2vec .vec format) is converted once into:
+
+- <prefix>.vectors.npy: float32 matrix with one row per word
+- <prefix>.words: the words in row order, utf-8, one per line
+- <prefix>.offsets.npy: byte offset of every word in <prefix>.words (plus the end of the file)
+- <prefix>.order.npy: the rows sorted by word, for binary search of the vocabulary
+
+All files are opened with mmap, so opening the store takes milliseconds and processes on the same host share the pages.
+"""
+
+VECTORS_SUFFIX = ".vectors.npy"
+WORDS_SUFFIX = ".words"
+OFFSETS_SUFFIX = ".offsets.npy"
+ORDER_SUFFIX = ".order.npy"
+
+
+class WordVectors(object):
+    """ Read-only word vectors of a converted store, supports the part of gensim's KeyedVectors interface that is used"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.path = prefix + VECTORS_SUFFIX
+        self.vectors = np.load(self.path, mmap_mode='r').view(np.ndarray)
+        self.vector_size = self.vectors.shape[1]
+        self.offsets = np.load(prefix + OFFSETS_SUFFIX, mmap_mode='r').view(np.ndarray)
+        self.order = np.load(prefix + ORDER_SUFFIX, mmap_mode='r').view(np.ndarray)
+        self.words = b""
+        if os.path.getsize(prefix + WORDS_SUFFIX) > 0:
+            with open(prefix + WORDS_SUFFIX, "rb") as f:
+                self.words = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __getstate__(self):
+        # The mmaps are reopened when unpickled, e.g. when shipped to Spark executors
+        return {"prefix": self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state["prefix"])
+
+    @property
+    def wv(self):
+        """ Same object, like gensim models that keep their vectors in model.wv"""
+        return self
+
+    @property
+    def vocab(self):
+        """ Same object, for membership tests like `word in model.vocab`"""
+        return self
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, word):
+        return self.row(word) >= 0
+
+    def word(self, row):
+        """ Word (utf-8) of a row"""
+        return self.words[self.offsets[row]:self.offsets[row + 1] - 1]
+
+    def row(self, word):
+        """ Row of a word, -1 if the word is not in the vocabulary"""
+        key = utf8_key(word)
+        if key is None:
+            return -1
+        lo = 0
+        hi = len(self.order)
+        # Leftmost match, which is the first occurrence of a word that is duplicated in the text file
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word(self.order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.order) and self.word(self.order[lo]) == key:
+            return int(self.order[lo])
+        return -1
+
+    def __getitem__(self, word):
+        row = self.row(word)
+        if row < 0:
+            raise KeyError("word '%s' not in vocabulary" % word)
+        return np.array(self.vectors[row])
+
+    def similarity(self, word1, word2):
+        """ Cosine similarity between the vectors of two words"""
+        vectors = similarity_engine.unit_vectors([self[word1], self[word2]], self.vector_size)
+        return np.dot(vectors[0], vectors[1])
+
+
+def utf8_key(word):
+    """
+    Key of a word in the store. Byte strings must be ascii, like lookups of str in the unicode vocabulary
+    of gensim, None if the word can never be in the vocabulary
+    """
+    if isinstance(word, bytes):
+        try:
+            word.decode("ascii")
+        except UnicodeDecodeError:
+            return None
+        return word
+    return word.encode("utf-8")
+
+
+def store_prefix(path):
+    """ Prefix of the converted store of a word vectors file"""
+    root, ext = os.path.splitext(path)
+    if ext in [".vec", ".txt"]:
+        return root
+    return path
+
+
+def is_converted(path):
+    """ Whether the word vectors file has a converted store that is at least as new as the file"""
+    prefix = store_prefix(path)
+    if not os.path.exists(prefix + VECTORS_SUFFIX):
+        return False
+    if prefix == path or not os.path.exists(path):
+        return True
+    return os.path.getmtime(prefix + VECTORS_SUFFIX) >= os.path.getmtime(path)
+
+
+def convert(vec_path, prefix):
+    """
+    Convert a text word vectors file to a store. Each file is written to a temporary file first and renamed,
+    the vectors file last, so a concurrent reader never sees a partial store.
+    """
+    tmp = ".tmp" + str(os.getpid())
+    words = []
+    offsets = [0]
+    with open(vec_path, "rb") as f, open(prefix + WORDS_SUFFIX + tmp, "wb") as words_file:
+        count, dim = map(int, f.readline().split())
+        vectors = np.lib.format.open_memmap(prefix + VECTORS_SUFFIX + tmp, mode="w+", dtype=np.float32,
+                                            shape=(count, dim))
+        for i in range(count):
+            line = f.readline()
+            if line == b"":
+                raise ValueError("unexpected end of input in {0}, expected {1} vectors".format(vec_path, count))
+            parts = line.rstrip().split(b" ")
+            if len(parts) != dim + 1:
+                raise ValueError("invalid vector on line {0} of {1}".format(i + 2, vec_path))
+            vectors[i] = np.array(parts[1:], dtype=np.float32)
+            words.append(parts[0])
+            words_file.write(parts[0] + b"\n")
+            offsets.append(offsets[-1] + len(parts[0]) + 1)
+        vectors.flush()
+        del vectors
+    order = sorted(range(count), key=words.__getitem__)
+    with open(prefix + OFFSETS_SUFFIX + tmp, "wb") as f:
+        np.save(f, np.array(offsets, dtype=np.int64))
+    with open(prefix + ORDER_SUFFIX + tmp, "wb") as f:
+        np.save(f, np.array(order, dtype=np.int64))
+    for suffix in [WORDS_SUFFIX, OFFSETS_SUFFIX, ORDER_SUFFIX, VECTORS_SUFFIX]:
+        os.rename(prefix + suffix + tmp, prefix + suffix)
+
+
+def load(path):
+    """
+    Open the word vectors of path, which is either a store prefix or a text word vectors file.
+    A text file is converted the first time it is loaded, after that its store is used.
+    """
+    if not is_converted(path):
+        convert(path, store_prefix(path))
+    return WordVectors(store_prefix(path))
+
+
+def parse_args():
+    """Parses the commandline arguments with argparse"""
+    parser = argparse.ArgumentParser(description='Convert text word vectors to a memory-mapped store')
+    parser.add_argument("-i", "--input", help="path to text word vectors file", default="./vectors/vectors.vec")
+    parser.add_argument("-o", "--output", help="prefix of the store files, defaults to the input without extension",
+                        default="")
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    """ Convert a text word vectors file"""
+    args = parse_args()
+    prefix = args.output
+    if prefix == "":
+        prefix = store_prefix(args.input)
+    convert(args.input, prefix)
+    print("converted {0} to {1}".format(args.input, prefix))
+
+
+if __name__ == '__main__':
+    main()